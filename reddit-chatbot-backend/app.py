@@ -1,67 +1,180 @@
 import os
 import time
 import json
-import sqlite3
+import uuid
+import random
+import hashlib
+import base64
+import re
+import io
+import threading
 import requests
+from concurrent.futures import ThreadPoolExecutor, Future
+from urllib.parse import urlparse, urljoin
 import xml.etree.ElementTree as ET
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g
+from PIL import Image
 from flask_cors import CORS
 import praw
-from llm_prompt import build_llm_prompt
+import prawcore
+from praw.exceptions import RedditAPIException
+from llm_prompt import build_llm_prompt, build_blog_index, estimate_tokens
+import db
+import metrics
+import dedup_store
+import near_dup
 from dotenv import load_dotenv
 
 load_dotenv()
 app = Flask(__name__)
-CORS(app, resources={r"/*": {"origins": "*"}})
-DATABASE_FILE = 'bot_data_v2.db' # Using the new database file
+CORS(app, resources={r"/*": {"origins": "*"}}, expose_headers=["ETag"])
 
 # region Sitemap Integration
 SITEMAP_URLS = ['https://scalpsusa.com/post-sitemap.xml', 'https://scalpsusa.com/page-sitemap.xml']
-def fetch_sitemap_urls():
-    urls = []
+SITEMAP_CACHE_FILE = os.getenv("SITEMAP_CACHE_FILE", "sitemap_cache.json")
+SITEMAP_REFRESH_SECONDS = int(os.getenv("SITEMAP_REFRESH_SECONDS", str(6*60*60))) # 0 disables background refresh
+
+def load_sitemap_cache():
+    try:
+        with open(SITEMAP_CACHE_FILE, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"sitemaps": {}}
+    except (OSError, ValueError) as e:
+        app.logger.error(f"Ignoring unreadable sitemap cache {SITEMAP_CACHE_FILE}: {e}")
+        return {"sitemaps": {}}
+
+def save_sitemap_cache(cache):
+    tmp_path = f"{SITEMAP_CACHE_FILE}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f)
+    os.replace(tmp_path, SITEMAP_CACHE_FILE)
+
+def fetch_sitemap_urls(cache):
+    """
+    Re-checks every sitemap with If-None-Match / If-Modified-Since and returns the updated
+    cache. A 304 or a failed fetch keeps the previously cached entry for that sitemap.
+    """
     ns = {'ns': 'http://www.sitemaps.org/schemas/sitemap/0.9'}
+    sitemaps = {}
     for sitemap in SITEMAP_URLS:
+        entry = cache["sitemaps"].get(sitemap, {})
+        headers = {}
+        if entry.get("etag"): headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"): headers["If-Modified-Since"] = entry["last_modified"]
         try:
-            resp = requests.get(sitemap, timeout=10)
+            resp = requests.get(sitemap, headers=headers, timeout=10)
+            if resp.status_code == 304:
+                sitemaps[sitemap] = {**entry, "checked_at": time.time()}
+                continue
             resp.raise_for_status()
             root = ET.fromstring(resp.content)
-            urls.extend(loc.text for loc in root.findall('.//ns:loc', ns))
-        except requests.RequestException as e:
+            sitemaps[sitemap] = {
+                "urls": [loc.text for loc in root.findall('.//ns:loc', ns)], "checked_at": time.time(),
+                "etag": resp.headers.get("ETag"), "last_modified": resp.headers.get("Last-Modified")
+            }
+        except (requests.RequestException, ET.ParseError) as e:
             app.logger.error(f"Failed to fetch sitemap {sitemap}: {e}")
-    return urls
-BLOG_URLS = fetch_sitemap_urls()
-app.logger.info(f"Loaded {len(BLOG_URLS)} blog URLs.")
+            if entry: sitemaps[sitemap] = entry
+    return {"sitemaps": sitemaps}
+
+def sitemap_age(cache):
+    checked = [e.get("checked_at") for e in cache["sitemaps"].values()]
+    return time.time() - min(checked) if checked and all(checked) else None
+
+def apply_sitemap_cache(cache):
+    """Builds the blog index off to the side, then swaps it in with a single assignment."""
+    global SITEMAP_CACHE, BLOG_INDEX
+    urls = [u for entry in cache["sitemaps"].values() for u in entry.get("urls", [])]
+    SITEMAP_CACHE, BLOG_INDEX = cache, build_blog_index(urls)
+    app.logger.info(f"Loaded {len(BLOG_INDEX)} blog URLs.")
+
+def refresh_sitemaps_forever():
+    age = sitemap_age(SITEMAP_CACHE)
+    delay = 0 if age is None else max(0, SITEMAP_REFRESH_SECONDS - age)
+    while True:
+        time.sleep(delay)
+        try:
+            cache = fetch_sitemap_urls(SITEMAP_CACHE)
+            apply_sitemap_cache(cache)
+            save_sitemap_cache(cache)
+        except Exception as e:
+            app.logger.error(f"Sitemap refresh failed: {e}")
+        delay = SITEMAP_REFRESH_SECONDS
+
+# Serve from the on-disk copy straight away; the network refresh happens in the background
+apply_sitemap_cache(load_sitemap_cache())
+if SITEMAP_REFRESH_SECONDS > 0:
+    threading.Thread(target=refresh_sitemaps_forever, name="sitemap-refresh", daemon=True).start()
 # endregion
 
 # region Database
-def get_db_connection():
-    conn = sqlite3.connect(DATABASE_FILE)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-with app.app_context():
-    conn = get_db_connection()
-    c = conn.cursor()
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS suggestions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT, submission_id TEXT UNIQUE NOT NULL,
-            title TEXT, subreddit TEXT, author TEXT, selftext TEXT, post_url TEXT,
-            image_urls TEXT, suggested_comment TEXT DEFAULT '', created_utc REAL,
-            added_at REAL DEFAULT (strftime('%s','now'))
-        )
-    ''')
-    try:
-        c.execute("ALTER TABLE suggestions ADD COLUMN author TEXT")
-    except sqlite3.OperationalError:
-        pass # Column already exists
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS posted_submissions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT, submission_id TEXT UNIQUE NOT NULL,
-            posted_at REAL DEFAULT (strftime('%s','now'))
-        )
-    ''')
-    conn.commit()
-    conn.close()
+get_db_connection = db.get_connection # Per-thread persistent connection; commit, don't close
+db.migrate()
+
+@app.teardown_request
+def release_db_transaction(exc):
+    db.rollback_open_transaction() # A request that failed mid-write must not keep holding the write lock
+
+DEDUP_COMPACT_SECONDS = int(os.getenv("DEDUP_COMPACT_SECONDS", str(6*60*60))) # 0 disables retention/compaction
+DEDUP_MAX_CHECK = 1000
+
+def compact_dedup_forever():
+    while True:
+        time.sleep(DEDUP_COMPACT_SECONDS)
+        try:
+            removed = dedup_store.store.compact(get_db_connection())
+            app.logger.info(f"Dedup compaction removed {removed} expired entries.")
+        except Exception as e:
+            app.logger.error(f"Dedup compaction failed: {e}")
+            db.rollback_open_transaction()
+
+if DEDUP_COMPACT_SECONDS > 0:
+    threading.Thread(target=compact_dedup_forever, name="dedup-compaction", daemon=True).start()
+# endregion
+
+# region Metrics
+http_seconds = metrics.histogram("http_request_seconds", "Flask request latency by route.", ("method", "route", "status"))
+gemini_seconds = metrics.histogram("gemini_request_seconds", "Each Gemini generateContent attempt by outcome (ok, http_<status>, network_error).", ("outcome",))
+gemini_prompt_chars = metrics.histogram("gemini_prompt_chars", "Prompt size sent to Gemini, in characters.", buckets=metrics.SIZE_BUCKETS)
+prompt_tokens = metrics.histogram("prompt_tokens_estimated", "Estimated prompt size after trimming to PROMPT_TOKEN_BUDGET.",
+                                  buckets=(100, 250, 500, 750, 1000, 1500, 2000, 4000, 8000))
+gemini_response_chars = metrics.histogram("gemini_response_chars", "Generated comment size, in characters.", buckets=metrics.SIZE_BUCKETS)
+llm_cache_lookups = metrics.counter("llm_cache_lookups_total", "LLM response cache lookups by result.", ("result",))
+reddit_seconds = metrics.histogram("reddit_api_request_seconds", "Reddit API calls made by the poster.", ("method", "status"))
+reddit_remaining = metrics.gauge("reddit_ratelimit_remaining", "Requests left in Reddit's current rate-limit window.", ("client",))
+dedup_entries = metrics.gauge("dedup_entries", "Submissions remembered by the dedup store, by state.", ("state",))
+near_duplicates = metrics.counter("near_duplicates_total", "Ingested posts grouped under an existing suggestion, by match (crosspost, simhash).", ("match",))
+queue_depth = metrics.gauge("queue_items", "Rows per status in the suggestions and post_outbox tables.", ("table", "status"))
+scraper_posts = metrics.counter("scraper_posts_total", "Posts seen by the scraper per stage (listed, filtered, deduped, sent, failed).", ("stage", "subreddit"))
+scraper_pushes = metrics.counter("scraper_pushes_total", "Stats pushes received from the scraper.", ("mode",))
+scraper_run_seconds = metrics.histogram("scraper_run_seconds", "Wall time of one-shot scraper runs.", buckets=(1, 5, 10, 30, 60, 120, 300, 600))
+scraper_reddit_calls = metrics.counter("scraper_reddit_calls_total", "Reddit API calls made by the scraper.")
+scraper_last_push = metrics.gauge("scraper_last_push_timestamp_seconds", "When the scraper last pushed stats.")
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_latency(response):
+    if 'request_start' in g:
+        route = request.url_rule.rule if request.url_rule else "unmatched" # The rule, not the path, keeps IDs out of the labels
+        http_seconds.observe(time.perf_counter() - g.request_start, method=request.method, route=route, status=response.status_code)
+    return response
+
+class MeteredRequestor(prawcore.Requestor):
+    """Times every Reddit API call and records the x-ratelimit budget Reddit reports back."""
+    def request(self, method, *args, **kwargs):
+        start, status = time.perf_counter(), "error"
+        try:
+            response = super().request(method, *args, **kwargs)
+            status = response.status_code
+        finally:
+            reddit_seconds.observe(time.perf_counter() - start, method=method.upper(), status=status)
+        remaining = response.headers.get("x-ratelimit-remaining")
+        if remaining: reddit_remaining.set(float(remaining), client="poster")
+        return response
 # endregion
 
 # region API Clients
@@ -73,104 +186,832 @@ reddit_poster = None
 if all(os.getenv(k) for k in ["REDDIT_CLIENT_ID", "REDDIT_CLIENT_SECRET", "REDDIT_REFRESH_TOKEN", "REDDIT_USER_AGENT"]):
     reddit_poster = praw.Reddit(
         client_id=os.getenv("REDDIT_CLIENT_ID"), client_secret=os.getenv("REDDIT_CLIENT_SECRET"),
-        refresh_token=os.getenv("REDDIT_REFRESH_TOKEN"), user_agent=os.getenv("REDDIT_USER_AGENT")
+        refresh_token=os.getenv("REDDIT_REFRESH_TOKEN"), user_agent=os.getenv("REDDIT_USER_AGENT"),
+        requestor_class=MeteredRequestor
     )
 else:
     app.logger.error("Reddit poster not configured; posting disabled.")
 # endregion
 
+# region LLM Generation
+LLM_TIMEOUT = int(os.getenv("LLM_TIMEOUT", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_SECONDS = float(os.getenv("LLM_BACKOFF_SECONDS", "2"))
+LLM_WORKERS = int(os.getenv("LLM_WORKERS", "4"))
+LLM_QUEUE_LIMIT = int(os.getenv("LLM_QUEUE_LIMIT", "200"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+LLM_CACHE_MAX_AGE_SECONDS = int(os.getenv("LLM_CACHE_MAX_AGE_SECONDS", str(7*24*60*60)))
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "1000")) # Long posts are trimmed to keep the prompt under this
+# Longest a job can legitimately run: every attempt times out and waits out its backoff; doubled
+# for longer Retry-After waits. Queued jobs have no such limit, a bulk run can keep them waiting.
+JOB_MAX_RUN_SECONDS = 2 * ((LLM_MAX_RETRIES + 1) * LLM_TIMEOUT + sum(LLM_BACKOFF_SECONDS * 2 ** a + 0.5 for a in range(LLM_MAX_RETRIES)))
+JOB_SWEEP_SECONDS = 60
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+def call_llm(prompt):
+    """Calls Gemini, retrying 429/5xx responses and network errors with exponential backoff."""
+    gemini_prompt_chars.observe(len(prompt))
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        last_try, delay = attempt == LLM_MAX_RETRIES, 0.0
+        start, outcome = time.perf_counter(), "network_error"
+        try:
+            resp = requests.post(REST_ENDPOINT, params={"key": GOOGLE_API_KEY}, json={"contents": [{"parts": [{"text": prompt}]}]}, timeout=LLM_TIMEOUT)
+            outcome = f"http_{resp.status_code}"
+            if resp.status_code not in RETRYABLE_STATUS or last_try:
+                resp.raise_for_status()
+                comment = resp.json().get("candidates", [{}])[0].get("content", {}).get("parts", [{}])[0].get("text", "").strip()
+                if not comment: raise ValueError("Empty response from API")
+                outcome = "ok"
+                gemini_response_chars.observe(len(comment))
+                return comment
+            try:
+                delay = float(resp.headers.get("Retry-After", 0))
+            except ValueError:
+                pass # HTTP-date form; fall back to our own backoff
+            reason = f"HTTP {resp.status_code}"
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if last_try: raise
+            reason = str(e)
+        finally:
+            gemini_seconds.observe(time.perf_counter() - start, outcome=outcome)
+        delay = max(delay, LLM_BACKOFF_SECONDS * 2 ** attempt) + random.uniform(0, 0.5)
+        app.logger.warning(f"LLM call failed ({reason}); retry {attempt + 1}/{LLM_MAX_RETRIES} in {delay:.1f}s")
+        time.sleep(delay)
+
+llm_cache_stats = {"hits": 0, "misses": 0, "coalesced": 0, "bypassed": 0}
+llm_inflight, llm_inflight_lock = {}, threading.Lock()
+
+def count_llm_cache(stat):
+    with llm_inflight_lock:
+        llm_cache_stats[stat] += 1
+    llm_cache_lookups.inc(result=stat)
+
+def store_llm_response(key, response):
+    now = time.time()
+    conn = get_db_connection()
+    with conn:
+        conn.execute('INSERT OR REPLACE INTO llm_cache (key, model, response, created_at, last_used_at) VALUES (?,?,?,?,?)', (key, MODEL_NAME, response, now, now))
+        conn.execute('DELETE FROM llm_cache WHERE created_at < ?', (now - LLM_CACHE_MAX_AGE_SECONDS,))
+        conn.execute('DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)', (LLM_CACHE_MAX_ENTRIES,))
+
+def cached_response(key):
+    conn = get_db_connection()
+    row = conn.execute('SELECT response FROM llm_cache WHERE key=? AND created_at > ?', (key, time.time() - LLM_CACHE_MAX_AGE_SECONDS)).fetchone()
+    if not row: return None
+    with conn:
+        conn.execute('UPDATE llm_cache SET last_used_at=? WHERE key=?', (time.time(), key))
+    return row['response']
+
+def cached_llm_call(prompt, bypass_cache=False):
+    """
+    Serves a prompt from the SQLite response cache (keyed on model + prompt hash) when
+    possible. Identical prompts already in flight wait for that call instead of starting
+    their own. `bypass_cache` forces a fresh upstream call and replaces the cached entry.
+    """
+    key = hashlib.sha256(f"{MODEL_NAME}\n{prompt}".encode('utf-8')).hexdigest()
+    if not bypass_cache:
+        response = cached_response(key)
+        if response is not None:
+            count_llm_cache("hits")
+            return response
+
+    with llm_inflight_lock:
+        future = None if bypass_cache else llm_inflight.get(key)
+        leader = future is None
+        if leader:
+            future = Future()
+            if not bypass_cache: llm_inflight[key] = future
+    if not leader:
+        count_llm_cache("coalesced")
+        return future.result()
+
+    try:
+        # A previous leader may have stored the response and left llm_inflight between our
+        # cache miss and taking the lead
+        response = None if bypass_cache else cached_response(key)
+        count_llm_cache("bypassed" if bypass_cache else "misses" if response is None else "hits")
+        if response is None:
+            response = call_llm(prompt)
+            store_llm_response(key, response)
+        future.set_result(response)
+        return response
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with llm_inflight_lock:
+            if llm_inflight.get(key) is future: del llm_inflight[key]
+
+def generate_for_submission(submission_id, user_thought='', regenerate=False):
+    """
+    Builds the prompt for a stored suggestion, calls the LLM (through the cache) and saves
+    the draft. Returns (comment, estimated prompt tokens).
+    """
+    conn = get_db_connection()
+    row = conn.execute('SELECT * FROM suggestions WHERE submission_id=?',(submission_id,)).fetchone()
+    if not row: raise LookupError(f"Suggestion {submission_id} not found")
+    prompt = build_llm_prompt(row['title'], row['selftext'], row['post_url'], json.loads(row['image_urls']), user_thought, BLOG_INDEX, PROMPT_TOKEN_BUDGET)
+    tokens = estimate_tokens(prompt)
+    prompt_tokens.observe(tokens)
+    app.logger.info(f"Prompt for {submission_id}: ~{tokens} tokens (post body ~{estimate_tokens(row['selftext'])})")
+    comment = cached_llm_call(prompt, bypass_cache=regenerate)
+    conn = get_db_connection()
+    with conn:
+        conn.execute('UPDATE suggestions SET suggested_comment=? WHERE submission_id=?',(comment,submission_id))
+    return comment, tokens
+
+# A bounded pool serves queued jobs; the semaphore caps how many can wait for it
+llm_executor = ThreadPoolExecutor(max_workers=LLM_WORKERS, thread_name_prefix="llm")
+llm_queue_slots = threading.BoundedSemaphore(LLM_QUEUE_LIMIT)
+local_jobs = set() # Jobs this process has queued and not finished yet
+
+class GenerationConflict(Exception):
+    """A different draft request for the post is already running."""
+    def __init__(self, job_id):
+        super().__init__(f"Generation job {job_id} is already running for this post")
+        self.job_id = job_id
+
+def run_generation_job(job_id, submission_id, user_thought, regenerate=False):
+    status, error = None, None
+    try:
+        conn = get_db_connection()
+        with conn: # Not if it was superseded while it waited
+            started = conn.execute("UPDATE generation_jobs SET status='running', started_at=? WHERE id=? AND status='queued'", (time.time(), job_id)).rowcount
+        if started:
+            generate_for_submission(submission_id, user_thought, regenerate)
+            status = 'done'
+    except Exception as e:
+        app.logger.error(f"LLM generation job {job_id} failed for {submission_id}: {e}")
+        status, error = 'failed', str(e)
+    finally:
+        llm_queue_slots.release()
+    if status:
+        conn = get_db_connection()
+        with conn: # A job the sweep already failed stays failed
+            conn.execute("UPDATE generation_jobs SET status=?, error=?, finished_at=? WHERE id=? AND status IN ('queued','running')", (status, error, time.time(), job_id))
+    local_jobs.discard(job_id)
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass # Exists, under another user
+    return True
+
+def job_lost_reason(row, now):
+    """Why an active job can no longer finish, or None while it still can."""
+    if row['owner_pid'] == os.getpid():
+        if row['id'] not in local_jobs: return "Lost when its worker process stopped" # An earlier process with our pid
+    elif row['owner_pid'] is None or not process_alive(row['owner_pid']): # Workers share the host, like the SQLite file
+        return "Lost when its worker process stopped"
+    if row['status'] == 'running' and row['started_at'] and row['started_at'] < now - JOB_MAX_RUN_SECONDS:
+        return f"Still running after {JOB_MAX_RUN_SECONDS:.0f}s"
+    return None
+
+def expire_lost_jobs():
+    """Fails queued/running jobs whose process died (a restart or deploy) or that overran JOB_MAX_RUN_SECONDS."""
+    conn = get_db_connection()
+    now = time.time()
+    rows = conn.execute("SELECT id, status, owner_pid, started_at FROM generation_jobs WHERE status IN ('queued','running')").fetchall()
+    lost = []
+    for r in rows:
+        reason = job_lost_reason(r, now)
+        if reason: lost.append((reason, now, r['id']))
+    if lost:
+        with conn:
+            conn.executemany("UPDATE generation_jobs SET status='failed', error=?, finished_at=? WHERE id=? AND status IN ('queued','running')", lost)
+    return len(lost)
+
+def expire_lost_jobs_forever():
+    while True:
+        time.sleep(JOB_SWEEP_SECONDS)
+        try:
+            expired = expire_lost_jobs()
+            if expired: app.logger.warning(f"Failed {expired} lost generation job(s).")
+        except Exception as e:
+            app.logger.error(f"Generation job sweep failed: {e}")
+            db.rollback_open_transaction()
+
+def enqueue_generation(submission_id, user_thought='', regenerate=False):
+    """
+    Queues a generation job and returns its ID, or None if the queue is full. A plain request
+    (no thought, no regenerate) or one identical to a job already active for the post reuses
+    that job. A different one replaces jobs still queued, and raises GenerationConflict while
+    one is running.
+    """
+    user_thought, now = user_thought or '', time.time()
+    conn = get_db_connection()
+    rows = conn.execute("SELECT id, status, user_thought, regenerate, owner_pid, started_at FROM generation_jobs WHERE submission_id=? AND status IN ('queued','running')",
+                        (submission_id,)).fetchall()
+    active = [r for r in rows if not job_lost_reason(r, now)]
+    reusable = [r for r in active if (not user_thought and not regenerate) or (r['user_thought'] == user_thought and (r['regenerate'] or not regenerate))]
+    if reusable:
+        return reusable[0]['id']
+    running = [r for r in active if r['status'] == 'running']
+    if running:
+        raise GenerationConflict(running[0]['id'])
+    if not llm_queue_slots.acquire(blocking=False):
+        return None
+    job_id = uuid.uuid4().hex
+    local_jobs.add(job_id) # Before the row exists, so the sweep never sees it unowned
+    try:
+        with conn:
+            conn.execute("DELETE FROM generation_jobs WHERE finished_at < ?", (now - 24*60*60,))
+            conn.executemany("UPDATE generation_jobs SET status='failed', error=?, finished_at=? WHERE id=? AND status='queued'",
+                             [(f"Superseded by job {job_id}", now, r['id']) for r in active])
+            conn.execute('INSERT INTO generation_jobs (id, submission_id, user_thought, regenerate, owner_pid, created_at) VALUES (?,?,?,?,?,?)',
+                         (job_id, submission_id, user_thought, int(regenerate), os.getpid(), now))
+    except Exception:
+        local_jobs.discard(job_id)
+        llm_queue_slots.release()
+        raise
+    llm_executor.submit(run_generation_job, job_id, submission_id, user_thought, regenerate)
+    return job_id
+
+def job_json(row):
+    return {"job_id": row['id'], "submission_id": row['submission_id'], "status": row['status'], "error": row['error'],
+            "created_at": row['created_at'], "started_at": row['started_at'], "finished_at": row['finished_at'],
+            "suggestedComment": row['suggested_comment']}
+
+JOB_SELECT_SQL = 'SELECT j.*, s.suggested_comment FROM generation_jobs j LEFT JOIN suggestions s ON s.submission_id = j.submission_id'
+
+expire_lost_jobs() # Leftovers from before a restart
+threading.Thread(target=expire_lost_jobs_forever, name="job-sweep", daemon=True).start()
+# endregion
+
+# region Posting Outbox
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+OUTBOX_BACKOFF_SECONDS = float(os.getenv("OUTBOX_BACKOFF_SECONDS", "30"))
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "10"))
+OUTBOX_SENDING_STALE_SECONDS = 5*60 # A post "sending" this long lost its worker mid-reply
+REDDIT_WINDOW_SECONDS, REDDIT_MIN_REMAINING = 600, 2
+PERMANENT_POST_ERRORS = (prawcore.exceptions.Forbidden, prawcore.exceptions.NotFound, prawcore.exceptions.BadRequest)
+
+outbox_wakeup = threading.Event()
+outbox_paused_until = 0.0 # Reddit's comment rate limit is per account, so one RATELIMIT pauses every post
+
+def enqueue_post(submission_id, comment, kind):
+    """
+    Puts an approved comment in the outbox and takes the suggestion off the review queue.
+    Idempotent on submission_id: a post that is already queued, sending or posted is left
+    alone. Returns the outbox status.
+    """
+    now = time.time()
+    conn = get_db_connection()
+    with conn:
+        existing = conn.execute('SELECT status FROM post_outbox WHERE submission_id=?', (submission_id,)).fetchone()
+        if existing and existing['status'] != 'failed':
+            return existing['status']
+        conn.execute('''
+            INSERT OR REPLACE INTO post_outbox (submission_id, comment, kind, status, attempts, next_attempt_at, created_at, updated_at)
+            VALUES (?, ?, ?, 'queued', 0, ?, ?, ?)
+        ''', (submission_id, comment, kind, now, now, now))
+        # A queued post stands on its own; if posting fails it comes back as an ordinary suggestion
+        conn.execute("UPDATE suggestions SET status='queued', suggested_comment=?, canonical_id=NULL WHERE submission_id=?", (comment, submission_id))
+    outbox_wakeup.set()
+    return 'queued'
+
+def post_retry_delay(error, attempts):
+    """Seconds to wait before retrying, or None if the error won't go away on its own."""
+    if isinstance(error, RedditAPIException):
+        ratelimit = next((item for item in error.items if item.error_type == "RATELIMIT"), None)
+        if not ratelimit: return None # THREAD_LOCKED, DELETED_LINK, ...
+        match = re.search(r'(\d+) (millisecond|second|minute)', ratelimit.message)
+        amount, unit = (int(match.group(1)), match.group(2)) if match else (10, "minute")
+        return amount * {"millisecond": 0.001, "second": 1, "minute": 60}[unit] + 1
+    if isinstance(error, PERMANENT_POST_ERRORS):
+        return None
+    return min(OUTBOX_BACKOFF_SECONDS * 2 ** (attempts - 1), 60*60)
+
+def wait_for_reddit_budget():
+    """Sleeps through a RATELIMIT pause or, when the x-ratelimit budget is spent, until the window resets."""
+    delay = outbox_paused_until - time.time()
+    remaining = reddit_poster.auth.limits.get("remaining")
+    if remaining is not None and remaining < REDDIT_MIN_REMAINING:
+        delay = max(delay, REDDIT_WINDOW_SECONDS - time.time() % REDDIT_WINDOW_SECONDS)
+    if delay > 0:
+        app.logger.info(f"Outbox pausing {delay:.0f}s for Reddit's rate limit.")
+        time.sleep(delay)
+
+def already_replied(submission_id):
+    """Checks the bot's latest comments for a reply to the post (used after a crash mid-reply)."""
+    return any(c.link_id == f"t3_{submission_id}" for c in reddit_poster.user.me().comments.new(limit=100))
+
+def mark_posted(submission_id, comment_id=None):
+    conn = get_db_connection()
+    with conn:
+        conn.execute("UPDATE post_outbox SET status='posted', comment_id=?, last_error=NULL, updated_at=? WHERE submission_id=?", (comment_id, time.time(), submission_id))
+        dedup_store.store.record(conn, submission_id, 'posted')
+        conn.execute('DELETE FROM suggestions WHERE submission_id=?',(submission_id,))
+
+def recover_stale_posts():
+    conn = get_db_connection()
+    stale = conn.execute("SELECT submission_id FROM post_outbox WHERE status='sending' AND updated_at < ?", (time.time() - OUTBOX_SENDING_STALE_SECONDS,)).fetchall()
+    for row in stale:
+        if already_replied(row['submission_id']):
+            mark_posted(row['submission_id'])
+        else:
+            with conn:
+                conn.execute("UPDATE post_outbox SET status='queued', updated_at=? WHERE submission_id=? AND status='sending'", (time.time(), row['submission_id']))
+
+def dispatch_next_post():
+    """Claims and posts the next due outbox entry. Returns False when nothing is due."""
+    global outbox_paused_until
+    conn = get_db_connection()
+    row = conn.execute("SELECT * FROM post_outbox WHERE status='queued' AND next_attempt_at <= ? ORDER BY next_attempt_at LIMIT 1", (time.time(),)).fetchone()
+    if not row: return False
+    # Sleep before claiming: a row held in 'sending' through a long rate-limit pause would look
+    # stale to another worker's recover_stale_posts, which would requeue and post it a second time
+    wait_for_reddit_budget()
+    # The status check makes the claim atomic across gunicorn workers
+    with conn:
+        claimed = conn.execute("UPDATE post_outbox SET status='sending', attempts=attempts+1, updated_at=? WHERE submission_id=? AND status='queued'",
+                               (time.time(), row['submission_id'])).rowcount
+    if not claimed: return True
+    row = conn.execute('SELECT * FROM post_outbox WHERE submission_id=?', (row['submission_id'],)).fetchone() # As claimed, after the wait
+
+    submission_id, attempts = row['submission_id'], row['attempts']
+    try:
+        reply = reddit_poster.submission(id=submission_id).reply(row['comment'])
+    except Exception as e:
+        delay = post_retry_delay(e, attempts)
+        if isinstance(e, RedditAPIException) and delay:
+            outbox_paused_until = time.time() + delay
+        if delay is None or attempts >= OUTBOX_MAX_ATTEMPTS:
+            app.logger.error(f"Giving up posting to Reddit for {submission_id} after {attempts} attempt(s): {e}")
+            with conn: # Back to the review queue so a reviewer can retry or reject it
+                conn.execute("UPDATE post_outbox SET status='failed', last_error=?, updated_at=? WHERE submission_id=?", (str(e), time.time(), submission_id))
+                conn.execute("UPDATE suggestions SET status='pending' WHERE submission_id=? AND status='queued'", (submission_id,))
+        else:
+            app.logger.warning(f"Posting to Reddit for {submission_id} failed ({e}); retrying in {delay:.0f}s")
+            with conn:
+                conn.execute("UPDATE post_outbox SET status='queued', last_error=?, next_attempt_at=?, updated_at=? WHERE submission_id=?",
+                             (str(e), time.time() + delay, time.time(), submission_id))
+        return True
+    mark_posted(submission_id, getattr(reply, 'id', None))
+    app.logger.info(f"Posted queued {row['kind']} comment to {submission_id}")
+    return True
+
+def dispatch_outbox_forever():
+    while True:
+        try:
+            recover_stale_posts()
+            while dispatch_next_post(): pass
+        except Exception as e:
+            app.logger.error(f"Outbox dispatcher error: {e}")
+            db.rollback_open_transaction()
+        outbox_wakeup.wait(timeout=OUTBOX_POLL_SECONDS)
+        outbox_wakeup.clear()
+
+if reddit_poster and os.getenv("OUTBOX_DISPATCHER", "1") != "0":
+    threading.Thread(target=dispatch_outbox_forever, name="outbox-dispatcher", daemon=True).start()
+# endregion
+
+# region Image Proxy
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", "image_cache")
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_MB", "500")) * 1024 * 1024
+IMAGE_MAX_SOURCE_BYTES = 25 * 1024 * 1024
+IMAGE_CACHE_MAX_AGE = 30*24*60*60 # A post's images never change, so browsers can keep thumbnails this long
+THUMBNAIL_SIZE = int(os.getenv("THUMBNAIL_SIZE", "216")) # Short side in px; the dashboard's 100px tiles at 2x DPI
+# Image URLs come from unauthenticated ingest, so the proxy only ever fetches from Reddit's (and imgur's) media hosts
+IMAGE_HOSTS = set(os.getenv("IMAGE_PROXY_HOSTS", "i.redd.it,preview.redd.it,external-preview.redd.it,i.imgur.com").split(","))
+IMAGE_MAX_REDIRECTS = 3
+
+image_requests = metrics.counter("image_proxy_requests_total", "Thumbnail requests by result (hit, miss, error, blocked).", ("result",))
+image_cache_lock = threading.Lock()
+image_cache_bytes = None # Running total for this process; a directory scan corrects it on every eviction
+
+def allowed_image_url(url):
+    try:
+        parts = urlparse(url)
+        return parts.scheme == "https" and parts.hostname in IMAGE_HOSTS and parts.port in (None, 443)
+    except (TypeError, ValueError, AttributeError): # Not a string, or a malformed port
+        return False
+
+def thumbnail_source(full_url, previews):
+    """The smallest Reddit preview that still covers THUMBNAIL_SIZE, falling back to the full-size image."""
+    big_enough = [p for p in previews if isinstance(p, dict) and allowed_image_url(p.get("u")) and min(p.get("x", 0), p.get("y", 0)) >= THUMBNAIL_SIZE]
+    return min(big_enough, key=lambda p: p["x"])["u"] if big_enough else full_url
+
+def fetch_image(url):
+    """Downloads an image from IMAGE_HOSTS, following redirects only while they stay on those hosts."""
+    headers = {"User-Agent": os.getenv("REDDIT_USER_AGENT") or "reddit-chatbot-backend"}
+    for _ in range(IMAGE_MAX_REDIRECTS + 1):
+        if not allowed_image_url(url): raise ValueError(f"Image host not allowed: {url}")
+        with requests.get(url, headers=headers, timeout=15, stream=True, allow_redirects=False) as resp:
+            if resp.is_redirect:
+                url = urljoin(url, resp.headers["Location"])
+                continue
+            resp.raise_for_status()
+            content = resp.raw.read(IMAGE_MAX_SOURCE_BYTES + 1, decode_content=True)
+        if len(content) > IMAGE_MAX_SOURCE_BYTES: raise ValueError(f"Image larger than {IMAGE_MAX_SOURCE_BYTES} bytes")
+        return content
+    raise ValueError(f"Too many redirects fetching {url}")
+
+def make_thumbnail(content):
+    """Scales the image (first frame for GIFs) so its short side is THUMBNAIL_SIZE and re-encodes it as JPEG."""
+    with Image.open(io.BytesIO(content)) as img:
+        scale = THUMBNAIL_SIZE / min(img.size)
+        size = (max(1, round(img.width * scale)), max(1, round(img.height * scale))) if scale < 1 else img.size
+        img.draft("RGB", size) # Lets JPEG decode straight at a reduced scale
+        thumb = img.convert("RGB").resize(size, Image.LANCZOS)
+    out = io.BytesIO()
+    thumb.save(out, "JPEG", quality=80, optimize=True, progressive=True)
+    return out.getvalue()
+
+def evict_images():
+    """Deletes the least recently served thumbnails (hits touch the file's mtime) down to 90% of the cap."""
+    entries = []
+    for entry in os.scandir(IMAGE_CACHE_DIR):
+        try:
+            if entry.name.endswith(".jpg"): entries.append((entry.stat().st_mtime, entry.stat().st_size, entry.path))
+        except FileNotFoundError:
+            pass # Evicted by another worker mid-scan
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= IMAGE_CACHE_MAX_BYTES * 0.9: break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+    return total
+
+def cache_image(path, content):
+    global image_cache_bytes
+    os.makedirs(IMAGE_CACHE_DIR, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+    with image_cache_lock:
+        image_cache_bytes = evict_images() if image_cache_bytes is None else image_cache_bytes + len(content)
+        if image_cache_bytes > IMAGE_CACHE_MAX_BYTES: image_cache_bytes = evict_images()
+# endregion
+
 # region Routes
+PRIORITY_SUBREDDITS = {"smpchat"}
+PAGE_SIZE, MAX_PAGE_SIZE = 50, 200
+DELTA_LIMIT = MAX_PAGE_SIZE # More changes than this (e.g. after a bulk draft run) answer `reset` instead
+SYNC_SKEW_SECONDS = 5 # Deltas overlap a little so writes committed mid-read aren't missed
+
+def suggestion_json(r, duplicates=()):
+    return {
+        "id": r['submission_id'], "redditPostTitle": r['title'], "subreddit": r['subreddit'],
+        "author": r['author'], "redditPostSelftext": r['selftext'], "redditPostUrl": r['post_url'],
+        "image_urls": json.loads(r['image_urls']), "suggestedComment": r['suggested_comment'],
+        "priority": r['priority'], "added_at": r['added_at'],
+        "duplicates": [{"id": d['submission_id'], "subreddit": d['subreddit'], "redditPostUrl": d['post_url']} for d in duplicates]
+    }
+
+def suggestions_json(conn, rows):
+    groups = near_dup.members(conn, [r['submission_id'] for r in rows])
+    return [suggestion_json(r, groups.get(r['submission_id'], ())) for r in rows]
+
+def encode_cursor(row):
+    raw = json.dumps([row['priority'], row['added_at'], row['id']]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    priority, added_at, row_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    return priority, added_at, row_id
+
 @app.route('/suggestions', methods=['GET'])
 def list_suggestions():
+    """
+    Pending suggestions, highest priority (SMPchat) first, then newest.
+    - Pages: `limit` (default 50) and `cursor` (the previous page's `next_cursor`).
+    - Deltas: `since=<sync_token>` returns only rows changed since then plus the IDs that
+      left the queue, or `reset: true` if the token is older than the tombstone history or
+      more than DELTA_LIMIT rows changed.
+    Responses carry an ETag from the table's write counter, so unchanged polls get a 304.
+    Near-duplicates (cross-posts) are listed under their canonical item's `duplicates`.
+    """
+    since = request.args.get('since', type=float)
+    if 'since' in request.args and since is None:
+        return jsonify({"error": "Invalid since token."}), 400
     conn = get_db_connection()
-    rows = conn.execute('''
-        SELECT s.* FROM suggestions s LEFT JOIN posted_submissions ps 
-        ON s.submission_id = ps.submission_id WHERE ps.submission_id IS NULL
-        ORDER BY s.added_at DESC
-    ''').fetchall()
-    conn.close()
-    
-    output_data = [{
-        "id": r['submission_id'], "redditPostTitle": r['title'], "subreddit": r['subreddit'],
-        "author": r['author'], "redditPostSelftext": r['selftext'], "redditPostUrl": r['post_url'],
-        "image_urls": json.loads(r['image_urls']), "suggestedComment": r['suggested_comment']
-    } for r in rows]
-    return jsonify(output_data)
+    version = conn.execute('SELECT version FROM sync_version').fetchone()[0]
+    # A delta is empty whenever nothing was written since the client's last response, so
+    # its ETag is just the version; pages also depend on their cursor and limit
+    etag = str(version) if 'since' in request.args else f"{version}-{hashlib.md5(request.query_string).hexdigest()[:12]}"
+    if request.if_none_match.contains_weak(etag):
+        resp = app.response_class(status=304)
+        resp.set_etag(etag, weak=True)
+        return resp
+
+    now = conn.execute(f'SELECT {db.NOW_SQL}').fetchone()[0]
+    body = {"sync_token": now - SYNC_SKEW_SECONDS}
+    if since is not None:
+        if since < now - db.TOMBSTONE_RETENTION_SECONDS:
+            body["reset"] = True
+        else:
+            changed = conn.execute('SELECT * FROM suggestions WHERE updated_at > ? ORDER BY priority DESC, added_at DESC, id DESC LIMIT ?', (since, DELTA_LIMIT + 1)).fetchall()
+            if len(changed) > DELTA_LIMIT:
+                body["reset"] = True
+            else:
+                gone = conn.execute('SELECT submission_id FROM removed_suggestions WHERE removed_at > ?', (since,)).fetchall()
+                body["items"] = suggestions_json(conn, [r for r in changed if r['status'] == 'pending'])
+                body["removed"] = [r['submission_id'] for r in changed if r['status'] != 'pending'] + [r['submission_id'] for r in gone]
+    else:
+        limit = max(1, min(request.args.get('limit', PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+        query, params = "SELECT * FROM suggestions WHERE status = 'pending'", []
+        if request.args.get('cursor'):
+            try:
+                params = list(decode_cursor(request.args['cursor']))
+            except (ValueError, TypeError):
+                return jsonify({"error": "Invalid cursor."}), 400
+            query += ' AND (priority, added_at, id) < (?, ?, ?)'
+        rows = conn.execute(f'{query} ORDER BY priority DESC, added_at DESC, id DESC LIMIT ?', params + [limit + 1]).fetchall()
+        body["items"] = suggestions_json(conn, rows[:limit])
+        body["next_cursor"] = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+
+    resp = jsonify(body)
+    resp.set_etag(etag, weak=True)
+    return resp
+
+# Posted and rejected submissions never re-enter the queue
+INSERT_SUGGESTION_SQL = '''
+    INSERT OR IGNORE INTO suggestions (submission_id, title, subreddit, author, selftext, post_url, image_urls, image_previews, created_utc, priority, simhash, canonical_id, status)
+    SELECT ?,?,?,?,?,?,?,?,?,?,?,?,? WHERE NOT EXISTS (SELECT 1 FROM submission_states WHERE submission_id=? AND state IN ('posted','rejected'))
+'''
+
+def suggestion_params(data, signature=None, canonical_id=None):
+    return (data.get('submission_id'), data.get('redditPostTitle'), data.get('subreddit'), data.get('author'),
+            data.get('redditPostSelftext'), data.get('redditPostUrl'), json.dumps(data.get('image_urls', [])),
+            json.dumps(data.get('image_previews') or []), time.time(),
+            int((data.get('subreddit') or '').lower() in PRIORITY_SUBREDDITS), signature, canonical_id,
+            'duplicate' if canonical_id else 'pending', data.get('submission_id'))
+
+def insert_suggestion(conn, data):
+    """
+    Inserts a scraped post, grouped under a pending near-duplicate if it has one so the
+    whole group shares a single draft and review. Returns (added, canonical_id).
+    """
+    # SimHash matches are per author, so posts without one only ever group as cross-posts
+    signature = None if data.get('author') in near_dup.UNKNOWN_AUTHORS else near_dup.simhash(data.get('redditPostTitle'), data.get('redditPostSelftext'))
+    canonical_id, match = near_dup.find_canonical(conn, data.get('submission_id'), data.get('author'), signature, data.get('crosspost_parent'))
+    if not conn.execute(INSERT_SUGGESTION_SQL, suggestion_params(data, signature, canonical_id)).rowcount:
+        return False, None
+    if canonical_id: near_duplicates.inc(match=match)
+    return True, canonical_id
 
 @app.route('/suggestions', methods=['POST'])
 def add_suggestion():
     data = request.get_json() or {}
     conn = get_db_connection()
-    conn.execute(
-        'INSERT OR IGNORE INTO suggestions (submission_id, title, subreddit, author, selftext, post_url, image_urls, created_utc) VALUES (?,?,?,?,?,?,?,?)',
-        (data.get('submission_id'), data.get('redditPostTitle'), data.get('subreddit'), data.get('author'),
-         data.get('redditPostSelftext'), data.get('redditPostUrl'), json.dumps(data.get('image_urls', [])), time.time())
-    )
-    conn.commit()
-    conn.close()
-    return jsonify({"message": "added"}), 201
+    with conn:
+        added, canonical_id = insert_suggestion(conn, data)
+        if added: dedup_store.store.record(conn, data.get('submission_id'), 'seen')
+    return jsonify({"message": "added", "duplicate_of": canonical_id}), 201
+
+@app.route('/suggestions/batch', methods=['POST'])
+def add_suggestions_batch():
+    data = request.get_json() or {}
+    items = data if isinstance(data, list) else data.get('suggestions', [])
+    if not isinstance(items, list): return jsonify({"error": "Expected a list of suggestions."}), 400
+
+    results = []
+    conn = get_db_connection()
+    with conn: # One transaction (and one fsync) for the whole batch
+        for item in items:
+            if not isinstance(item, dict) or not item.get('submission_id'):
+                results.append({"submission_id": item.get('submission_id') if isinstance(item, dict) else None, "status": "invalid"})
+                continue
+            added, canonical_id = insert_suggestion(conn, item)
+            results.append({"submission_id": item['submission_id'], "status": "added" if added else "duplicate"})
+            if canonical_id: results[-1]["duplicate_of"] = canonical_id
+        dedup_store.store.record_many(conn, [r['submission_id'] for r in results if r['status'] == 'added'], 'seen')
+
+    added = sum(r['status'] == 'added' for r in results)
+    return jsonify({"added": added, "duplicates": sum(r['status'] == 'duplicate' for r in results), "results": results}), 201 if added else 200
 
 @app.route('/suggestions/<submission_id>/generate', methods=['POST'])
 def generate_comment(submission_id):
     if not GOOGLE_API_KEY: return jsonify({"error":"LLM not configured"}), 500
-    data, conn = request.get_json() or {}, get_db_connection()
-    row = conn.execute('SELECT * FROM suggestions WHERE submission_id=?',(submission_id,)).fetchone()
-    conn.close()
-    if not row: return jsonify({"error":"not found"}), 404
-    prompt = build_llm_prompt(row['title'], row['selftext'], row['post_url'], json.loads(row['image_urls']), data.get('user_thought',''), BLOG_URLS)
-    try:
-        resp = requests.post(REST_ENDPOINT, params={"key": GOOGLE_API_KEY}, json={"contents": [{"parts": [{"text": prompt}]}]})
-        resp.raise_for_status()
-        comment = resp.json().get("candidates", [{}])[0].get("content", {}).get("parts", [{}])[0].get("text", "").strip()
-        if not comment: raise ValueError("Empty response from API")
+    data = request.get_json() or {}
+    if data.get('async') or request.args.get('async') in ('1', 'true'):
         conn = get_db_connection()
-        conn.execute('UPDATE suggestions SET suggested_comment=? WHERE submission_id=?',(comment,submission_id))
-        conn.commit()
-        conn.close()
-        return jsonify({"suggestedComment": comment})
+        exists = conn.execute('SELECT 1 FROM suggestions WHERE submission_id=?',(submission_id,)).fetchone()
+        if not exists: return jsonify({"error":"not found"}), 404
+        try:
+            job_id = enqueue_generation(submission_id, data.get('user_thought',''), bool(data.get('regenerate')))
+        except GenerationConflict as e:
+            return jsonify({"error": "A draft is already being generated for this post; try again when it finishes.", "job_id": e.job_id}), 409
+        if not job_id: return jsonify({"error": "Generation queue is full, try again shortly."}), 429
+        return jsonify({"job_id": job_id, "status_url": f"/jobs/{job_id}"}), 202
+    try:
+        comment, tokens = generate_for_submission(submission_id, data.get('user_thought',''), bool(data.get('regenerate')))
+        return jsonify({"suggestedComment": comment, "promptTokens": tokens})
+    except LookupError:
+        return jsonify({"error":"not found"}), 404
     except Exception as e:
         app.logger.error(f"LLM generation failed for {submission_id}: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/suggestions/generate-pending', methods=['POST'])
+def generate_pending():
+    """Queues a draft for every pending suggestion that doesn't have one yet."""
+    if not GOOGLE_API_KEY: return jsonify({"error":"LLM not configured"}), 500
+    conn = get_db_connection()
+    rows = conn.execute('''
+        SELECT submission_id FROM suggestions WHERE status = 'pending'
+        AND (suggested_comment IS NULL OR suggested_comment = '')
+        ORDER BY added_at DESC
+    ''').fetchall()
+
+    jobs, skipped = [], 0
+    for r in rows:
+        job_id = enqueue_generation(r['submission_id'])
+        if job_id: jobs.append({"submission_id": r['submission_id'], "job_id": job_id})
+        else: skipped += 1
+    return jsonify({"queued": len(jobs), "skipped": skipped, "jobs": jobs}), 202
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    conn = get_db_connection()
+    row = conn.execute(f'{JOB_SELECT_SQL} WHERE j.id=?', (job_id,)).fetchone()
+    if not row: return jsonify({"error":"not found"}), 404
+    return jsonify(job_json(row))
+
+@app.route('/jobs', methods=['GET'])
+def list_jobs():
+    ids = [i for i in request.args.get('ids', '').split(',') if i]
+    conn = get_db_connection()
+    if ids:
+        rows = conn.execute(f'{JOB_SELECT_SQL} WHERE j.id IN ({",".join("?" * len(ids))})', ids).fetchall()
+    else:
+        rows = conn.execute(f"{JOB_SELECT_SQL} WHERE j.status IN ('queued','running') ORDER BY j.created_at").fetchall()
+    return jsonify([job_json(r) for r in rows])
+
+def queued_post_response(submission_id, comment, kind, include_duplicates=True):
+    """
+    Queues the comment for the post and, unless `include_duplicates` is false, for each of
+    its near-duplicates too; otherwise those go back to the review queue on their own.
+    """
+    conn = get_db_connection()
+    duplicates = near_dup.member_ids(conn, submission_id)
+    status = enqueue_post(submission_id, comment, kind)
+    if include_duplicates:
+        for duplicate_id in duplicates: enqueue_post(duplicate_id, comment, kind)
+    elif duplicates:
+        with conn: near_dup.release(conn, submission_id)
+    body = {"status": status, "duplicates": duplicates if include_duplicates else []}
+    if status == 'posted': return jsonify({"message": "already posted", **body}), 200
+    return jsonify({"message": "queued for posting", **body}), 202
+
 @app.route('/suggestions/<submission_id>/approve-and-post', methods=['POST'])
 def approve_and_post(submission_id):
     if not reddit_poster: return jsonify({"error":"Reddit not configured"}), 500
-    comment = (request.get_json() or {}).get("approved_comment")
+    data = request.get_json() or {}
+    comment = data.get("approved_comment")
     if not comment: return jsonify({"error": "No comment content provided."}), 400
-    try:
-        reddit_poster.submission(id=submission_id).reply(comment)
-        conn = get_db_connection()
-        conn.execute('INSERT OR IGNORE INTO posted_submissions (submission_id) VALUES (?)',(submission_id,))
-        conn.execute('DELETE FROM suggestions WHERE submission_id=?',(submission_id,))
-        conn.commit()
-        conn.close()
-        return jsonify({"message":"posted"})
-    except Exception as e:
-        app.logger.error(f"Failed to post to Reddit for {submission_id}: {e}")
-        return jsonify({"error": f"Failed to post to Reddit: {str(e)}"}), 500
+    return queued_post_response(submission_id, comment, 'approved', data.get('include_duplicates', True) is not False)
 
 @app.route('/suggestions/<submission_id>/post-direct', methods=['POST'])
 def post_direct(submission_id):
     if not reddit_poster: return jsonify({"error":"Reddit not configured"}), 500
-    comment = (request.get_json() or {}).get('direct_comment','')
+    data = request.get_json() or {}
+    comment = data.get('direct_comment','')
     if not comment: return jsonify({"error": "Cannot post an empty comment."}), 400
+    return queued_post_response(submission_id, comment, 'direct', data.get('include_duplicates', True) is not False)
+
+@app.route('/outbox', methods=['GET'])
+def list_outbox():
+    """Posts waiting to go out or that failed; `?status=posted` shows recent successes instead."""
+    statuses = request.args.get('status', 'queued,sending,failed').split(',')
+    conn = get_db_connection()
+    rows = conn.execute(f'SELECT * FROM post_outbox WHERE status IN ({",".join("?" * len(statuses))}) ORDER BY updated_at DESC LIMIT 200', statuses).fetchall()
+    return jsonify([{
+        "submission_id": r['submission_id'], "kind": r['kind'], "status": r['status'], "attempts": r['attempts'],
+        "next_attempt_at": r['next_attempt_at'], "last_error": r['last_error'], "comment_id": r['comment_id']
+    } for r in rows])
+
+@app.route('/dedup/check', methods=['POST'])
+def dedup_check():
+    """Which of `ids` the dedup store already knows, as {"known": {id: "seen"|"rejected"|"posted"}}."""
+    ids = (request.get_json(silent=True) or {}).get('ids')
+    if not isinstance(ids, list) or len(ids) > DEDUP_MAX_CHECK:
+        return jsonify({"error": f"Expected a list of at most {DEDUP_MAX_CHECK} ids."}), 400
+    return jsonify({"known": dedup_store.store.known(get_db_connection(), [str(i) for i in ids])})
+
+@app.route('/dedup/record', methods=['POST'])
+def dedup_record():
+    """Records `ids` in the dedup store as `state`; the scraper reports the bot's own comments as "posted"."""
+    data = request.get_json(silent=True) or {}
+    ids, state = data.get('ids'), data.get('state')
+    if not isinstance(ids, list) or len(ids) > DEDUP_MAX_CHECK or state not in dedup_store.STATES:
+        return jsonify({"error": f"Expected a list of at most {DEDUP_MAX_CHECK} ids and a state ({', '.join(dedup_store.STATES)})."}), 400
+    conn = get_db_connection()
+    with conn:
+        dedup_store.store.record_many(conn, [str(i) for i in ids], state)
+    return jsonify({"recorded": len(ids)}), 200
+
+@app.route('/images/<submission_id>/<int:index>', methods=['GET'])
+def image_thumbnail(submission_id, index):
+    """
+    Downsized thumbnail of a suggestion's `index`-th image, built from Reddit's closest
+    preview and cached on disk (LRU-evicted past IMAGE_CACHE_MAX_MB). The full-size
+    image is still loaded straight from Reddit, and only by the lightbox.
+    """
+    conn = get_db_connection()
+    row = conn.execute('SELECT image_urls, image_previews FROM suggestions WHERE submission_id=?', (submission_id,)).fetchone()
+    urls = json.loads(row['image_urls']) if row else []
+    if index >= len(urls): return jsonify({"error": "not found"}), 404
+    previews = json.loads(row['image_previews'])
+    source = thumbnail_source(urls[index], previews[index] if index < len(previews) else [])
+    if not allowed_image_url(source):
+        image_requests.inc(result="blocked")
+        return jsonify({"error": "Image host not allowed."}), 404
+    key = hashlib.sha256(f"{THUMBNAIL_SIZE}\n{source}".encode('utf-8')).hexdigest()
+    path = os.path.join(IMAGE_CACHE_DIR, f"{key}.jpg")
+
     try:
-        reddit_poster.submission(id=submission_id).reply(comment)
-        conn = get_db_connection()
-        conn.execute('INSERT OR IGNORE INTO posted_submissions (submission_id) VALUES (?)',(submission_id,))
-        conn.execute('DELETE FROM suggestions WHERE submission_id=?',(submission_id,))
-        conn.commit()
-        conn.close()
-        return jsonify({"message":"direct posted"})
-    except Exception as e:
-        app.logger.error(f"Failed to post DIRECTLY to Reddit for {submission_id}: {e}")
-        return jsonify({"error": f"Failed to post directly to Reddit: {str(e)}"}), 500
+        with open(path, "rb") as f:
+            content = f.read()
+        os.utime(path)
+        image_requests.inc(result="hit")
+    except FileNotFoundError:
+        try:
+            content = make_thumbnail(fetch_image(source))
+        except (requests.RequestException, ValueError, OSError, Image.DecompressionBombError) as e:
+            image_requests.inc(result="error")
+            app.logger.warning(f"Thumbnail for {submission_id}/{index} failed ({source}): {e}")
+            return jsonify({"error": "Could not load image."}), 502
+        cache_image(path, content)
+        image_requests.inc(result="miss")
+
+    resp = app.response_class(content, mimetype="image/jpeg")
+    resp.set_etag(key)
+    resp.cache_control.public, resp.cache_control.max_age, resp.cache_control.immutable = True, IMAGE_CACHE_MAX_AGE, True
+    return resp.make_conditional(request)
+
+@app.route('/llm/cache/stats', methods=['GET'])
+def llm_cache_status():
+    conn = get_db_connection()
+    entries = conn.execute('SELECT COUNT(*) FROM llm_cache').fetchone()[0]
+    with llm_inflight_lock:
+        stats, inflight = dict(llm_cache_stats), len(llm_inflight)
+    lookups = stats["hits"] + stats["misses"] + stats["coalesced"]
+    return jsonify({**stats, "entries": entries, "inflight": inflight, "max_entries": LLM_CACHE_MAX_ENTRIES,
+                    "hit_rate": round((stats["hits"] + stats["coalesced"]) / lookups, 3) if lookups else None})
+
+@app.route('/sitemap/status', methods=['GET'])
+def sitemap_status():
+    age = sitemap_age(SITEMAP_CACHE)
+    return jsonify({
+        "url_count": len(BLOG_INDEX), "age_seconds": round(age) if age is not None else None,
+        "refresh_interval_seconds": SITEMAP_REFRESH_SECONDS,
+        "sitemaps": {url: {"url_count": len(e.get("urls", [])), "checked_at": e.get("checked_at")} for url, e in SITEMAP_CACHE["sitemaps"].items()}
+    })
+
+QUEUE_STATUSES = {"suggestions": ("pending", "duplicate", "queued", "posted"), "post_outbox": ("queued", "sending", "posted", "failed")}
+SCRAPER_STAGES = ("listed", "filtered", "deduped", "sent", "failed")
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """
+    Prometheus text format. Queue depths are sampled here; everything else accumulates as it
+    happens. Under several gunicorn workers, set METRICS_MULTIPROC_DIR so this reports every
+    worker's totals (see metrics.py) rather than whichever worker served the scrape.
+    """
+    conn = get_db_connection()
+    for table, statuses in QUEUE_STATUSES.items():
+        counts = dict(conn.execute(f'SELECT status, COUNT(*) FROM {table} GROUP BY status').fetchall())
+        for status in statuses:
+            queue_depth.set(counts.get(status, 0), table=table, status=status)
+    counts = dedup_store.store.counts(conn)
+    for state in dedup_store.STATES:
+        dedup_entries.set(counts.get(state, 0), state=state)
+    return app.response_class(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route('/metrics/scraper', methods=['POST'])
+def push_scraper_metrics():
+    """Per-run counts pushed by reddit_scraper.py, added onto the scraper_* series in /metrics."""
+    data = request.get_json(silent=True) or {}
+    subreddits = data.get('subreddits')
+    if not isinstance(subreddits, dict): return jsonify({"error": "Expected per-subreddit stats."}), 400
+    for name, stats in subreddits.items():
+        for stage in SCRAPER_STAGES:
+            if isinstance(stats, dict) and isinstance(stats.get(stage), (int, float)) and stats[stage] > 0:
+                scraper_posts.inc(stats[stage], stage=stage, subreddit=str(name).lower())
+    scraper_pushes.inc(mode='daemon' if data.get('mode') == 'daemon' else 'once')
+    if isinstance(data.get('duration_seconds'), (int, float)): scraper_run_seconds.observe(data['duration_seconds'])
+    if isinstance(data.get('reddit_calls'), int) and data['reddit_calls'] > 0: scraper_reddit_calls.inc(data['reddit_calls'])
+    if isinstance(data.get('ratelimit_remaining'), (int, float)): reddit_remaining.set(data['ratelimit_remaining'], client="scraper")
+    scraper_last_push.set(time.time())
+    return jsonify({"message": "recorded"}), 200
 
 @app.route('/suggestions/<submission_id>', methods=['DELETE'])
 def delete_suggestion(submission_id):
     conn = get_db_connection()
-    conn.execute('DELETE FROM suggestions WHERE submission_id=?',(submission_id,))
-    conn.commit()
-    conn.close()
+    with conn: # Rejected, along with its near-duplicates: remembered so the scraper doesn't bring them back
+        ids = [submission_id] + near_dup.member_ids(conn, submission_id)
+        if conn.execute('DELETE FROM suggestions WHERE submission_id=?',(submission_id,)).rowcount:
+            conn.executemany('DELETE FROM suggestions WHERE submission_id=?', [(i,) for i in ids[1:]])
+            dedup_store.store.record_many(conn, ids, 'rejected')
+        conn.execute("DELETE FROM post_outbox WHERE submission_id=? AND status='queued'",(submission_id,))
     return jsonify({"message":"deleted"}), 200
 # endregion
\ No newline at end of file
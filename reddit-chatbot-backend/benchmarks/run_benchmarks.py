@@ -0,0 +1,208 @@
+"""
+Offline benchmark suite for the backend and scraper.
+
+Everything runs against local stubs (benchmarks/stubs.py) and recorded fixtures, so no
+Reddit or Gemini credentials are needed and nothing is posted anywhere. Results are
+printed as JSON (or written with --output) so runs from different commits can be
+diffed, e.g.:
+
+    python benchmarks/run_benchmarks.py --output before.json
+    git checkout <other-commit>
+    python benchmarks/run_benchmarks.py --output after.json --compare before.json
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from stubs import StubServer, load_fixture
+
+SUBREDDITS = ["SMPchat", "Hairloss", "bald", "tressless"]
+
+def timed(fn, iterations):
+    """Runs fn `iterations` times; returns latency stats in milliseconds."""
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {"p50_ms": round(statistics.median(samples), 3), "p95_ms": round(samples[int(len(samples) * 0.95) - 1], 3),
+            "mean_ms": round(statistics.fmean(samples), 3), "iterations": iterations}
+
+def setup_environment(workdir, stub):
+    """Points the app and scraper at the stub server and throwaway files before they're imported."""
+    os.chdir(workdir)
+    with open("praw.ini", "w") as f: # PRAW only takes its API base URLs from praw.ini or kwargs
+        f.write(f"[DEFAULT]\noauth_url={stub.url}\nreddit_url={stub.url}\n")
+    os.environ.update({
+        "REDDIT_CLIENT_ID": "bench", "REDDIT_CLIENT_SECRET": "bench", "REDDIT_REFRESH_TOKEN": "bench",
+        "REDDIT_USER_AGENT": "benchmarks/1.0", "FLASK_BACKEND_URL": "http://127.0.0.1:9", "GOOGLE_API_KEY": "bench",
+        "DATABASE_FILE": os.path.join(workdir, "bench.db"),
+        "SCRAPER_STATE_PATH": os.path.join(workdir, "scraper_state.json"),
+        "SITEMAP_CACHE_FILE": os.path.join(workdir, "sitemap_cache.json"), "SITEMAP_REFRESH_SECONDS": "0",
+        "OUTBOX_DISPATCHER": "0",
+    })
+
+# region Benchmarks
+def bench_scraper(stub):
+    import reddit_scraper
+    results = {}
+    for workers in (1, len(SUBREDDITS)):
+        if os.path.exists(reddit_scraper.STATE_PATH): os.remove(reddit_scraper.STATE_PATH)
+        stub.counts.clear()
+        start = time.perf_counter()
+        posts, timings, _ = reddit_scraper.scrape_subreddits(SUBREDDITS, {}, workers=workers)
+        elapsed = time.perf_counter() - start
+        results[f"workers_{workers}"] = {
+            "wall_s": round(elapsed, 3), "posts_listed": stub.posts_per_subreddit * len(SUBREDDITS),
+            "posts_kept": len(posts), "listed_per_s": round(stub.posts_per_subreddit * len(SUBREDDITS) / elapsed, 1),
+            "listing_calls": sum(v for k, v in stub.counts.items() if k.startswith("listing:")),
+            "submission_fetches": stub.counts.get("submission", 0),
+            "per_subreddit_s": {name: round(t, 3) for name, t in timings.items()},
+        }
+    return results
+
+def fill_suggestions(app, count, start=0):
+    conn = app.get_db_connection()
+    rows = [app.suggestion_params({
+        "submission_id": f"b{i:07d}", "redditPostTitle": f"Benchmark post {i} about SMP and hairlines",
+        "subreddit": SUBREDDITS[i % len(SUBREDDITS)], "author": "bench", "redditPostSelftext": "Some body text. " * 40,
+        "redditPostUrl": f"https://reddit.com/r/bench/{i}", "image_urls": [],
+    }) for i in range(start, count)]
+    with conn:
+        conn.executemany(app.INSERT_SUGGESTION_SQL, rows)
+
+def bench_list(app, sizes, iterations):
+    client, results, filled = app.app.test_client(), {}, 0
+    for size in sizes:
+        fill_suggestions(app, size, filled)
+        filled = size
+        first = client.get("/suggestions")
+        body, etag = first.get_json(), first.headers.get("ETag")
+        cursor = body.get("next_cursor") if isinstance(body, dict) else None
+        results[str(size)] = {
+            "first_page": timed(lambda: client.get("/suggestions"), iterations),
+            "page_payload_bytes": len(first.data),
+            "next_page": timed(lambda: client.get(f"/suggestions?cursor={cursor}"), iterations) if cursor else None,
+            "not_modified": timed(lambda: client.get("/suggestions", headers={"If-None-Match": etag}), iterations) if etag else None,
+        }
+    return results
+
+def bench_ingest(app, total, batch_size):
+    client, results = app.app.test_client(), {}
+    posts = [{"submission_id": f"ing{i:07d}", "redditPostTitle": "Ingest benchmark", "subreddit": "bald", "author": f"bench_user{i}",
+              "redditPostSelftext": "Body " * 50, "redditPostUrl": "https://reddit.com", "image_urls": []} for i in range(total)]
+    start = time.perf_counter()
+    for post in posts[:total // 4]:
+        client.post("/suggestions", json=post)
+    results["single_posts_per_s"] = round((total // 4) / (time.perf_counter() - start), 1)
+    start = time.perf_counter()
+    for i in range(total // 4, total, batch_size):
+        client.post("/suggestions/batch", json={"suggestions": posts[i:i + batch_size]})
+    results["batch_posts_per_s"] = round((total - total // 4) / (time.perf_counter() - start), 1)
+    results["batch_size"] = batch_size
+    return results
+
+def bench_prompt(sizes, iterations):
+    import llm_prompt
+    words = ["smp", "scar", "hairline", "density", "women", "cost", "fade", "session", "crown", "alopecia", "shaved", "beard"]
+    listing = [c["data"] for c in load_fixture("reddit_new_listing.json")["data"]["children"]]
+    results = {}
+    for size in sizes:
+        urls = [f"https://scalpsusa.com/{words[i % 12]}-{words[(i * 7) % 12]}-guide-{i}/" for i in range(size)]
+        start = time.perf_counter()
+        index = llm_prompt.build_blog_index(urls)
+        build_ms = (time.perf_counter() - start) * 1000
+        counter = iter(range(10**9))
+        def build_uncached():
+            post = listing[next(counter) % len(listing)]
+            llm_prompt.build_llm_prompt(post["title"], f"{post['selftext']} #{next(counter)}", post["url"], [], "", index)
+        post = listing[0]
+        results[str(size)] = {
+            "index_build_ms": round(build_ms, 3),
+            "prompt": timed(build_uncached, iterations),
+            "prompt_cached": timed(lambda: llm_prompt.build_llm_prompt(post["title"], post["selftext"], post["url"], [], "", index), iterations),
+        }
+    return results
+
+def bench_generate(app, stub, iterations):
+    client = app.app.test_client()
+    app.REST_ENDPOINT = f"{stub.url}/v1beta/models/bench:generateContent"
+    fill_suggestions(app, 1, 0)
+    submission_id = "b0000000"
+    return {
+        "stub_llm_latency_ms": stub.llm_latency * 1000,
+        "fresh": timed(lambda: client.post(f"/suggestions/{submission_id}/generate", json={"regenerate": True}), iterations),
+        "cached": timed(lambda: client.post(f"/suggestions/{submission_id}/generate", json={}), iterations),
+    }
+# endregion
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def flatten(results, prefix=""):
+    for key, value in results.items():
+        if isinstance(value, dict): yield from flatten(value, f"{prefix}{key}.")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool): yield f"{prefix}{key}", value
+
+def compare(current, baseline_path):
+    with open(baseline_path) as f:
+        baseline = dict(flatten(json.load(f)["results"]))
+    for key, value in flatten(current["results"]):
+        if key in baseline and baseline[key]:
+            change = (value - baseline[key]) / baseline[key] * 100
+            print(f"{key:70s} {baseline[key]:>12g} -> {value:>12g}  ({change:+.1f}%)", file=sys.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", help="write the JSON results here instead of stdout")
+    parser.add_argument("--compare", help="print per-metric changes against an earlier results file")
+    parser.add_argument("--list-sizes", default="1000,10000,100000", help="row counts for the /suggestions benchmark")
+    parser.add_argument("--sitemap-sizes", default="100,1000,10000", help="blog URL counts for the prompt benchmark")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--posts-per-subreddit", type=int, default=300)
+    parser.add_argument("--reddit-latency", type=float, default=0.05, help="stub Reddit response delay (s)")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="stub Gemini response delay (s)")
+    args = parser.parse_args()
+
+    stub = StubServer(args.posts_per_subreddit, args.reddit_latency, args.llm_latency).start()
+    # The scraper and app print progress; keep stdout for the JSON report alone
+    with tempfile.TemporaryDirectory(prefix="reddit-bot-bench-") as workdir, contextlib.redirect_stdout(sys.stderr):
+        setup_environment(workdir, stub)
+        import app # Imported only now so it picks up the benchmark environment
+
+        results = {
+            "scraper": bench_scraper(stub),
+            "suggestions_list": bench_list(app, [int(s) for s in args.list_sizes.split(",")], args.iterations),
+            "ingest": bench_ingest(app, 2000, 50),
+            "build_llm_prompt": bench_prompt([int(s) for s in args.sitemap_sizes.split(",")], args.iterations * 10),
+            "generate": bench_generate(app, stub, max(3, args.iterations // 10)),
+        }
+        app.db.close_connection()
+
+    report = {"revision": git_revision(), "timestamp": time.time(), "python": platform.python_version(), "results": results}
+    if args.compare:
+        with contextlib.redirect_stdout(sys.stdout if args.output else sys.stderr):
+            compare(report, args.compare)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+if __name__ == "__main__":
+    main()
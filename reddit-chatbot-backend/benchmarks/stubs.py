@@ -0,0 +1,120 @@
+import copy
+import json
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), encoding="utf-8") as f:
+        return json.load(f)
+
+class StubServer(ThreadingHTTPServer):
+    """
+    One local HTTP server that stands in for both Reddit (OAuth token, /api/v1/me,
+    /r/<sub>/new, /comments/<id>, /user/<name>/comments) and Gemini's generateContent endpoint.
+    Listings are the recorded fixture posts cycled out to `posts_per_subreddit` with
+    fresh IDs and timestamps; every response is delayed by `latency` seconds.
+    """
+    daemon_threads = True
+
+    def __init__(self, posts_per_subreddit=300, latency=0.05, llm_latency=0.5):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.posts_per_subreddit, self.latency, self.llm_latency = posts_per_subreddit, latency, llm_latency
+        self.listing_fixture = load_fixture("reddit_new_listing.json")["data"]["children"]
+        self.gemini_fixture = load_fixture("gemini_response.json")
+        self.counts, self.lock = {}, threading.Lock()
+        self.listings = {}
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_port}"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="stub-server", daemon=True).start()
+        return self
+
+    def count(self, key):
+        with self.lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def listing_for(self, subreddit):
+        """Newest-first posts for a subreddit, spread over the last 20 hours."""
+        with self.lock:
+            if subreddit not in self.listings:
+                now, posts = time.time(), []
+                for i in range(self.posts_per_subreddit):
+                    child = copy.deepcopy(self.listing_fixture[i % len(self.listing_fixture)])
+                    data, sid = child["data"], f"{subreddit[:3].lower()}{i:06d}"
+                    data.update(id=sid, name=f"t3_{sid}", subreddit=subreddit, subreddit_name_prefixed=f"r/{subreddit}",
+                                created_utc=now - i * (20*60*60 / self.posts_per_subreddit),
+                                permalink=f"/r/{subreddit}/comments/{sid}/post/")
+                    posts.append(child)
+                self.listings[subreddit] = posts
+            return self.listings[subreddit]
+
+    def find_post(self, submission_id):
+        with self.lock:
+            return next((p for posts in self.listings.values() for p in posts if p["data"]["id"] == submission_id), None)
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, payload, status=200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("x-ratelimit-remaining", "990")
+        self.send_header("x-ratelimit-used", "10")
+        self.send_header("x-ratelimit-reset", "300")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        path = urlparse(self.path).path
+        if path.endswith("/api/v1/access_token"):
+            return self.send_json({"access_token": "bench-token", "token_type": "bearer", "expires_in": 86400, "scope": "*"})
+        if path.endswith(":generateContent"):
+            self.server.count("gemini")
+            time.sleep(self.server.llm_latency)
+            return self.send_json(self.server.gemini_fixture)
+        self.send_json({"error": "not found"}, 404)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        time.sleep(self.server.latency)
+        if url.path == "/api/v1/me":
+            self.server.count("me")
+            return self.send_json({"name": "bench_bot", "id": "benchbot"})
+        if match := re.fullmatch(r"/r/([^/]+)/new", url.path):
+            self.server.count(f"listing:{match.group(1)}")
+            return self.send_json(self.page(self.server.listing_for(match.group(1)), query))
+        if match := re.fullmatch(r"/comments/([^/]+)/?", url.path): # PRAW's lazy fetch of a single submission
+            self.server.count("submission")
+            post = self.server.find_post(match.group(1))
+            if post is None: return self.send_json({"error": "not found"}, 404)
+            return self.send_json([{"kind": "Listing", "data": {"after": None, "before": None, "children": [post]}},
+                                   {"kind": "Listing", "data": {"after": None, "before": None, "children": []}}])
+        if re.fullmatch(r"/user/[^/]+/comments", url.path):
+            self.server.count("user_comments")
+            return self.send_json({"kind": "Listing", "data": {"after": None, "before": None, "dist": 0, "children": []}})
+        self.send_json({"error": "not found"}, 404)
+
+    @staticmethod
+    def page(posts, query):
+        start = 0
+        if query.get("after"):
+            start = next((i + 1 for i, p in enumerate(posts) if p["data"]["name"] == query["after"]), len(posts))
+        chunk = posts[start:start + min(int(query.get("limit", 25)), 100)]
+        after = chunk[-1]["data"]["name"] if chunk and start + len(chunk) < len(posts) else None
+        return {"kind": "Listing", "data": {"after": after, "before": None, "dist": len(chunk), "children": chunk}}
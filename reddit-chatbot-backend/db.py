@@ -0,0 +1,241 @@
+import os
+import re
+import sqlite3
+import threading
+from functools import lru_cache
+import metrics
+
+DATABASE_FILE = os.getenv("DATABASE_FILE", "bot_data_v2.db")
+
+# region Connections
+PRAGMAS = [
+    "PRAGMA journal_mode=WAL",      # Readers no longer block the writer (and vice versa)
+    "PRAGMA synchronous=NORMAL",    # Safe with WAL; fsync on checkpoint instead of every commit
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",     # ~16 MB page cache per connection
+    "PRAGMA mmap_size=134217728",
+]
+
+_local = threading.local()
+
+query_seconds = metrics.histogram("sqlite_query_seconds", "Time spent in Connection.execute/executemany.", ("statement", "table"))
+_TABLE_RE = re.compile(r"\b(?:FROM|INTO|UPDATE|TABLE|ON)\s+(?:IF\s+NOT\s+EXISTS\s+)?(?!OF\b)(\w+)", re.IGNORECASE)
+
+@lru_cache(maxsize=1024)
+def _statement_labels(sql):
+    """("SELECT", "suggestions") style labels; keyed on the first table so the series count stays small."""
+    table = _TABLE_RE.search(sql)
+    return {"statement": (sql.split(None, 1) or ["OTHER"])[0].upper(), "table": table.group(1).lower() if table else ""}
+
+class TimedConnection(sqlite3.Connection):
+    """Records how long each statement takes (fetching rows afterwards isn't included)."""
+    def execute(self, sql, *args):
+        with query_seconds.time(**_statement_labels(sql)):
+            return super().execute(sql, *args)
+
+    def executemany(self, sql, *args):
+        with query_seconds.time(**_statement_labels(sql)):
+            return super().executemany(sql, *args)
+
+def get_connection():
+    """
+    Returns this thread's persistent connection, opening it on first use.
+    Callers commit their own writes and must not close it.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DATABASE_FILE, timeout=5, factory=TimedConnection)
+        conn.row_factory = sqlite3.Row
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        _local.conn = conn
+    return conn
+
+def rollback_open_transaction():
+    """Rolls back whatever this thread's connection left uncommitted, so a failed write doesn't keep the lock."""
+    conn = getattr(_local, "conn", None)
+    if conn is not None and conn.in_transaction:
+        conn.rollback()
+
+def close_connection():
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
+# endregion
+
+# region Migrations
+NOW_SQL = "((julianday('now') - 2440587.5) * 86400.0)" # Unix time with sub-second precision
+TOMBSTONE_RETENTION_SECONDS = 7*24*60*60
+
+def _add_column(conn, table, column_sql):
+    name = column_sql.split()[0]
+    if name not in {r[1] for r in conn.execute(f"PRAGMA table_info({table})")}:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column_sql}")
+
+def _initial_schema(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS suggestions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, submission_id TEXT UNIQUE NOT NULL,
+            title TEXT, subreddit TEXT, author TEXT, selftext TEXT, post_url TEXT,
+            image_urls TEXT, suggested_comment TEXT DEFAULT '', created_utc REAL,
+            added_at REAL DEFAULT (strftime('%s','now'))
+        )
+    ''')
+    _add_column(conn, "suggestions", "author TEXT")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS posted_submissions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, submission_id TEXT UNIQUE NOT NULL,
+            posted_at REAL DEFAULT (strftime('%s','now'))
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS llm_cache (
+            key TEXT PRIMARY KEY, model TEXT, response TEXT NOT NULL,
+            created_at REAL NOT NULL, last_used_at REAL NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_llm_cache_last_used ON llm_cache (last_used_at)')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS generation_jobs (
+            id TEXT PRIMARY KEY, submission_id TEXT NOT NULL, user_thought TEXT DEFAULT '',
+            status TEXT NOT NULL DEFAULT 'queued', error TEXT, created_at REAL, finished_at REAL
+        )
+    ''')
+
+def _suggestion_status(conn):
+    # The pending queue used to be "suggestions LEFT JOIN posted_submissions"; a status
+    # column plus (status, added_at) turns it into a single index range scan.
+    _add_column(conn, "suggestions", "status TEXT NOT NULL DEFAULT 'pending'")
+    conn.execute("UPDATE suggestions SET status='posted' WHERE submission_id IN (SELECT submission_id FROM posted_submissions)")
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_suggestions_status_added ON suggestions (status, added_at)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_suggestions_added ON suggestions (added_at)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_generation_jobs_submission ON generation_jobs (submission_id, status)')
+
+def _sync_tracking(conn):
+    # Lets GET /suggestions serve keyset pages in priority order and "what changed since T"
+    # deltas: updated_at is touched by triggers, deletions leave a tombstone, and every
+    # write bumps one version counter that the ETag is derived from.
+    _add_column(conn, "suggestions", "priority INTEGER NOT NULL DEFAULT 0")
+    _add_column(conn, "suggestions", "updated_at REAL")
+    conn.execute("UPDATE suggestions SET priority = 1 WHERE lower(subreddit) = 'smpchat'")
+    conn.execute(f"UPDATE suggestions SET updated_at = {NOW_SQL} WHERE updated_at IS NULL")
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_suggestions_queue ON suggestions (status, priority, added_at, id)')
+    # The queue index serves every status lookup now; the old ones would only cost each insert
+    conn.execute('DROP INDEX IF EXISTS idx_suggestions_status_added')
+    conn.execute('DROP INDEX IF EXISTS idx_suggestions_added')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_suggestions_updated ON suggestions (updated_at)')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS removed_suggestions (
+            submission_id TEXT PRIMARY KEY, removed_at REAL NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_removed_suggestions_at ON removed_suggestions (removed_at)')
+    conn.execute('CREATE TABLE IF NOT EXISTS sync_version (id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL)')
+    conn.execute('INSERT OR IGNORE INTO sync_version (id, version) VALUES (1, 0)')
+    # Statement by statement: executescript() would commit the migration transaction early
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS suggestions_after_insert AFTER INSERT ON suggestions BEGIN
+            UPDATE suggestions SET updated_at = {NOW_SQL} WHERE id = NEW.id;
+            DELETE FROM removed_suggestions WHERE submission_id = NEW.submission_id;
+            UPDATE sync_version SET version = version + 1;
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS suggestions_after_update AFTER UPDATE OF suggested_comment, status ON suggestions BEGIN
+            UPDATE suggestions SET updated_at = {NOW_SQL} WHERE id = NEW.id;
+            UPDATE sync_version SET version = version + 1;
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS suggestions_after_delete AFTER DELETE ON suggestions BEGIN
+            INSERT OR REPLACE INTO removed_suggestions (submission_id, removed_at) VALUES (OLD.submission_id, {NOW_SQL});
+            DELETE FROM removed_suggestions WHERE removed_at < {NOW_SQL} - {TOMBSTONE_RETENTION_SECONDS};
+            UPDATE sync_version SET version = version + 1;
+        END
+    ''')
+
+def _post_outbox(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS post_outbox (
+            submission_id TEXT PRIMARY KEY, comment TEXT NOT NULL, kind TEXT NOT NULL DEFAULT 'approved',
+            status TEXT NOT NULL DEFAULT 'queued', attempts INTEGER NOT NULL DEFAULT 0, next_attempt_at REAL NOT NULL,
+            last_error TEXT, comment_id TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_post_outbox_due ON post_outbox (status, next_attempt_at)')
+
+def _image_previews(conn):
+    # Reddit's downsized renditions per image, so the thumbnail proxy rarely needs the full-size source
+    _add_column(conn, "suggestions", "image_previews TEXT NOT NULL DEFAULT '[]'")
+
+def _submission_states(conn):
+    # One dedup store for posted, rejected and already-ingested ("seen") submissions,
+    # replacing posted_submissions. `seq` lets each process's Bloom filter catch up incrementally.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS submission_states (
+            submission_id TEXT PRIMARY KEY, state TEXT NOT NULL, updated_at REAL NOT NULL, seq INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.execute(f'''
+        INSERT OR IGNORE INTO submission_states (submission_id, state, updated_at)
+        SELECT submission_id, 'posted', COALESCE(posted_at, {NOW_SQL}) FROM posted_submissions
+    ''')
+    conn.execute(f'''
+        INSERT OR IGNORE INTO submission_states (submission_id, state, updated_at)
+        SELECT submission_id, CASE status WHEN 'posted' THEN 'posted' ELSE 'seen' END, COALESCE(added_at, {NOW_SQL}) FROM suggestions
+    ''')
+    conn.execute('UPDATE submission_states SET seq = rowid')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_submission_states_seq ON submission_states (seq)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_submission_states_expiry ON submission_states (state, updated_at)')
+    conn.execute('DROP TABLE IF EXISTS posted_submissions')
+
+def _near_duplicates(conn):
+    # Cross-posts and copies of the same question are grouped under one "canonical" pending
+    # suggestion; the rest wait as status 'duplicate' and share its draft (see near_dup.py).
+    _add_column(conn, "suggestions", "simhash INTEGER")
+    _add_column(conn, "suggestions", "canonical_id TEXT")
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_suggestions_author ON suggestions (author, status)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_suggestions_canonical ON suggestions (canonical_id) WHERE canonical_id IS NOT NULL')
+    # A new duplicate changes its canonical's card, so it has to show up in the delta sync too
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS suggestions_after_insert_duplicate AFTER INSERT ON suggestions WHEN NEW.canonical_id IS NOT NULL BEGIN
+            UPDATE suggestions SET updated_at = {NOW_SQL} WHERE submission_id = NEW.canonical_id;
+        END
+    ''')
+
+def _job_owners(conn):
+    # Which process runs a generation job and since when, so only jobs whose process died or
+    # that overran every retry are failed (not ones still waiting in a busy queue)
+    _add_column(conn, "generation_jobs", "owner_pid INTEGER")
+    _add_column(conn, "generation_jobs", "started_at REAL")
+    _add_column(conn, "generation_jobs", "regenerate INTEGER NOT NULL DEFAULT 0")
+
+# Append only: each entry runs once, in order, and bumps PRAGMA user_version
+MIGRATIONS = [
+    (1, _initial_schema),
+    (2, _suggestion_status),
+    (3, _sync_tracking),
+    (4, _post_outbox),
+    (5, _image_previews),
+    (6, _submission_states),
+    (7, _near_duplicates),
+    (8, _job_owners),
+]
+
+def migrate():
+    conn = get_connection()
+    conn.execute("BEGIN IMMEDIATE") # Serialises workers that start at the same time
+    try:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for target, migration in MIGRATIONS:
+            if target > version:
+                migration(conn)
+                conn.execute(f"PRAGMA user_version={target}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    conn.execute("PRAGMA optimize")
+# endregion
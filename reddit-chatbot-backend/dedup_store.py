@@ -0,0 +1,105 @@
+import os
+import math
+import time
+import hashlib
+import threading
+
+STATES = ("seen", "rejected", "posted") # Ascending precedence; a submission never moves back down
+STATE_RANK_SQL = "CASE {col} WHEN 'posted' THEN 2 WHEN 'rejected' THEN 1 ELSE 0 END"
+# How long each state is remembered. The scraper only looks back a few days and Reddit
+# archives posts after six months, so older entries can't cause a duplicate anyway.
+RETENTION_SECONDS = {
+    "seen": int(os.getenv("DEDUP_SEEN_RETENTION_DAYS", "14")) * 24*60*60,
+    "rejected": int(os.getenv("DEDUP_REJECTED_RETENTION_DAYS", "60")) * 24*60*60,
+    "posted": int(os.getenv("DEDUP_POSTED_RETENTION_DAYS", "180")) * 24*60*60,
+}
+BLOOM_CAPACITY = int(os.getenv("DEDUP_BLOOM_CAPACITY", "200000"))
+SQL_CHUNK = 500 # Stay under SQLite's bound-parameter limit
+
+class BloomFilter:
+    """Fixed-size set membership with no false negatives and ~`error_rate` false positives at `capacity` items."""
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key: str):
+        for p in self._positions(key):
+            self.bits[p >> 3] |= 1 << (p & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(key))
+
+class DedupStore:
+    """
+    Posted / rejected / seen state per submission in the `submission_states` table,
+    shared by the app and (through POST /dedup/check) the scraper.
+
+    Lookups go through an in-memory Bloom filter first, so IDs that were never recorded
+    don't touch SQLite and possible hits are confirmed against the table. The filter
+    catches up with other workers' writes through the table's `seq` column and is
+    rebuilt after compaction, so its size stays fixed however long the history gets.
+    """
+
+    def __init__(self, capacity: int = BLOOM_CAPACITY):
+        self.capacity, self.lock = capacity, threading.Lock()
+        self.filter, self.synced_seq, self.loaded = None, 0, 0
+
+    def _catch_up(self, conn):
+        """Adds rows written since the last call (by any process) to the filter. Hold `self.lock`."""
+        if self.filter is None or self.loaded > self.capacity: # Past capacity the false-positive rate climbs
+            self.filter, self.synced_seq, self.loaded = BloomFilter(self.capacity), 0, 0
+        rows = conn.execute('SELECT submission_id, seq FROM submission_states WHERE seq > ? ORDER BY seq', (self.synced_seq,)).fetchall()
+        for submission_id, seq in rows:
+            self.filter.add(submission_id)
+        if rows: self.synced_seq, self.loaded = rows[-1][1], self.loaded + len(rows)
+
+    RECORD_SQL = f'''
+        INSERT INTO submission_states (submission_id, state, updated_at, seq)
+        VALUES (?, ?, ?, (SELECT COALESCE(MAX(seq), 0) + 1 FROM submission_states))
+        ON CONFLICT (submission_id) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at, seq = excluded.seq
+        WHERE {STATE_RANK_SQL.format(col="excluded.state")} >= {STATE_RANK_SQL.format(col="submission_states.state")}
+    '''
+
+    def record(self, conn, submission_id: str, state: str):
+        """Upserts a submission's state unless it already holds a stronger one. The caller commits."""
+        self.record_many(conn, [submission_id], state)
+
+    def record_many(self, conn, submission_ids: list, state: str):
+        if state not in STATES: raise ValueError(f"Unknown dedup state {state!r}")
+        now = time.time()
+        conn.executemany(self.RECORD_SQL, [(i, state, now) for i in submission_ids])
+
+    def known(self, conn, submission_ids: list) -> dict:
+        """{submission_id: state} for the IDs the store has; unknown IDs are left out."""
+        with self.lock:
+            self._catch_up(conn)
+            maybe = list({i for i in submission_ids if i in self.filter})
+        found = {}
+        for i in range(0, len(maybe), SQL_CHUNK):
+            chunk = maybe[i:i + SQL_CHUNK]
+            rows = conn.execute(f'SELECT submission_id, state FROM submission_states WHERE submission_id IN ({",".join("?" * len(chunk))})', chunk)
+            found.update((r[0], r[1]) for r in rows)
+        return found
+
+    def counts(self, conn) -> dict:
+        return dict(conn.execute('SELECT state, COUNT(*) FROM submission_states GROUP BY state').fetchall())
+
+    def compact(self, conn) -> int:
+        """Deletes entries past their state's retention and drops the filter so the next lookup rebuilds it."""
+        now, removed = time.time(), 0
+        with conn:
+            for state, retention in RETENTION_SECONDS.items():
+                removed += conn.execute('DELETE FROM submission_states WHERE state = ? AND updated_at < ?', (state, now - retention)).rowcount
+        if removed: conn.execute("PRAGMA optimize")
+        with self.lock:
+            self.filter = None
+        return removed
+
+store = DedupStore()
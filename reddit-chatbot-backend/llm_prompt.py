@@ -1,5 +1,8 @@
-import random
+import math
 import re
+import zlib
+from collections import defaultdict
+from functools import lru_cache
 from urllib.parse import urlparse, urlunparse, parse_qs, urlencode
 
 # --- PROMPT TEMPLATES ---
@@ -55,23 +58,119 @@ def add_utm_parameters(url: str) -> str:
     url_parts[4] = urlencode(query)
     return urlunparse(url_parts)
 
-def choose_relevant_blog_link(blog_urls, text):
-    """Chooses the most relevant blog link from a list based on text content."""
-    text = text.lower()
-    if not blog_urls:
-        return "None"
+# --- PROMPT BUDGET ---
+
+DEFAULT_PROMPT_TOKEN_BUDGET = 1000
+CHARS_PER_TOKEN = 4 # Gemini's rule of thumb for English text; close enough to bound cost without a tokenizer
+MIN_POST_TOKENS = 50
+TRIM_MARKER = "[…]"
+MIN_FRAGMENT_CHARS = 80 # Less room than this left for an over-long sentence isn't worth a cut-down piece of it
+# On-topic words that make a sentence worth keeping when a post has to be cut down
+FOCUS_TERMS = {"smp", "scalp", "micropigmentation", "hairline", "bald", "balding", "scar", "density", "thinning",
+               "shave", "shaved", "buzz", "tattoo", "pigment", "cost", "price", "session", "artist", "fade", "crown"}
+_SENTENCE_SPLIT = re.compile(r'(?<=[.!?])\s+|\n+')
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text or "") / CHARS_PER_TOKEN)
+
+def _tokenize(text):
+    """Splits text into lowercase word tokens, folding simple plurals ("scars" -> "scar")."""
+    return [t[:-1] if len(t) > 3 and t.endswith('s') and not t.endswith('ss') else t
+            for t in re.findall(r'[a-z0-9]+', text.lower())]
+
+class BlogIndex:
+    """
+    Inverted index from blog URL slug tokens to URLs, built once per sitemap load.
+    Each URL is scored by the IDF-weighted overlap between its slug tokens and the
+    words in the post, so a lookup only costs the number of distinct words in the post.
+    """
+
+    def __init__(self, blog_urls):
+        self.urls = sorted(set(blog_urls or []))
+        self.postings = defaultdict(list)
+        self.slug_sizes = {}
+        for url in self.urls:
+            tokens = {t for t in _tokenize(url.rstrip('/').split('/')[-1]) if len(t) > 2}
+            self.slug_sizes[url] = len(tokens) or 1
+            for token in tokens:
+                self.postings[token].append(url)
+        self.idf = {t: math.log((len(self.urls) + 1) / len(urls)) for t, urls in self.postings.items()}
+        self.best_match = lru_cache(maxsize=2048)(self._best_match)
+
+    def __len__(self):
+        return len(self.urls)
 
-    for url in blog_urls:
-        slug = url.rstrip('/').split('/')[-1]
-        for token in re.split(r'[-_]', slug):
-            if len(token) > 2 and token in text:
-                return url
-    
-    return random.choice(blog_urls)
+    def _best_match(self, text):
+        if not self.urls:
+            return "None"
+        scores = defaultdict(float)
+        for token in set(_tokenize(text)):
+            for url in self.postings.get(token, ()):
+                scores[url] += self.idf[token]
+        if scores:
+            # Highest score wins; ties go to the more specific (shorter) slug, then URL order
+            return min(scores, key=lambda u: (-scores[u] / math.sqrt(self.slug_sizes[u]), self.slug_sizes[u], u))
+        # No overlap: pick a stable URL per post so repeated prompts stay identical
+        return self.urls[zlib.crc32(text.encode('utf-8')) % len(self.urls)]
+
+def _relevance(sentence, focus):
+    tokens = _tokenize(sentence)
+    return sum(t in focus for t in tokens) / math.sqrt(len(tokens)) if tokens else 0.0
+
+def _shorten(text, max_chars):
+    """Head and tail of `text` around TRIM_MARKER, about `max_chars` long."""
+    half = max(0, max_chars - len(TRIM_MARKER) - 2) // 2
+    return f"{text[:half].rstrip()} {TRIM_MARKER} {text[len(text) - half:].lstrip()}"
+
+def trim_to_budget(text, max_tokens, keywords=()):
+    """
+    Returns `text` unchanged if it fits in `max_tokens`, otherwise a shortened version:
+    the first and last sentences (usually the situation and the actual question), then
+    as many middle sentences as fit, most on-topic first, kept in their original order
+    with TRIM_MARKER where text was cut. The first of those that doesn't fit whole (often
+    a run-on paragraph) is cut down to its head and tail to fill what's left.
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    sentences = [s for s in (part.strip() for part in _SENTENCE_SPLIT.split(text)) if s]
+    if not sentences: return ""
+    focus = FOCUS_TERMS | set(keywords)
+    cost = lambda i: len(sentences[i]) + len(TRIM_MARKER) + 2
+
+    chosen, used = {}, 0
+    middle = sorted(range(1, len(sentences) - 1), key=lambda i: (-_relevance(sentences[i], focus), i))
+    for i in [0, len(sentences) - 1] + middle:
+        if i in chosen: continue
+        if used + cost(i) <= max_chars:
+            chosen[i] = sentences[i]
+            used += cost(i)
+        elif max_chars - used - cost(i) + len(sentences[i]) >= MIN_FRAGMENT_CHARS:
+            chosen[i] = _shorten(sentences[i], max_chars - used - cost(i) + len(sentences[i]))
+            break # The budget is used up
+    if not chosen: # Too little budget for even a fragment
+        return _shorten(text, max_chars)
+
+    parts, previous = [], -1
+    for i in sorted(chosen):
+        if i != previous + 1: parts.append(TRIM_MARKER)
+        parts.append(chosen[i])
+        previous = i
+    if previous != len(sentences) - 1: parts.append(TRIM_MARKER)
+    return " ".join(parts)
+
+def build_blog_index(blog_urls):
+    return blog_urls if isinstance(blog_urls, BlogIndex) else BlogIndex(blog_urls)
+
+def choose_relevant_blog_link(blog_urls, text):
+    """Chooses the most relevant blog link for the text. Accepts a BlogIndex or a plain URL list."""
+    return build_blog_index(blog_urls).best_match(text.lower())
 
-def build_llm_prompt(title, selftext, url, image_urls, user_thoughts, blog_urls):
+def build_llm_prompt(title, selftext, url, image_urls, user_thoughts, blog_urls, max_tokens=DEFAULT_PROMPT_TOKEN_BUDGET):
     """
     Builds the complete prompt by selecting the correct template based on user input.
+    `blog_urls` should be a prebuilt BlogIndex; a plain list is indexed on every call.
+    The post body is trimmed so the whole prompt stays within about `max_tokens`.
     """
     combined_text = f"{title} {selftext}"
     base_blog_link = choose_relevant_blog_link(blog_urls, combined_text)
@@ -86,8 +185,10 @@ def build_llm_prompt(title, selftext, url, image_urls, user_thoughts, blog_urls)
         )
     else:
         # User did not provide thoughts, so we use the creative "Creator" prompt
+        fixed_tokens = estimate_tokens(GENERATION_PROMPT_TEMPLATE.format(title=title, selftext="", blog_link=final_blog_link_with_utm))
+        post_budget = max(MIN_POST_TOKENS, max_tokens - fixed_tokens)
         return GENERATION_PROMPT_TEMPLATE.format(
             title=title,
-            selftext=selftext or "None",
+            selftext=trim_to_budget(selftext or "None", post_budget, _tokenize(title or "")),
             blog_link=final_blog_link_with_utm
         )
\ No newline at end of file
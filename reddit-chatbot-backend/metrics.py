@@ -0,0 +1,241 @@
+import os
+import json
+import glob
+import atexit
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+log = logging.getLogger(__name__)
+
+# region Metric types
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000)
+
+class Metric:
+    kind = None
+
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        self.name, self.help, self.labels = name, help_text, tuple(labels)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(l, "")) for l in self.labels)
+
+    def label_str(self, key: tuple, extra: dict = None) -> str:
+        pairs = list(zip(self.labels, key)) + list((extra or {}).items())
+        if not pairs: return ""
+        escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+        return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+    def copy_values(self) -> dict:
+        with self.lock:
+            return dict(self.values)
+
+    def export(self) -> list:
+        """This process's series as JSON-friendly [label values, value] pairs."""
+        return [[list(k), v] for k, v in self.copy_values().items()]
+
+    @staticmethod
+    def combine(a, b):
+        return a + b
+
+    def merge(self, exports) -> dict:
+        """Folds several processes' `export()`s into one {label values: value} dict."""
+        merged = {}
+        for export in exports:
+            for key, value in export:
+                key = tuple(key)
+                merged[key] = self.combine(merged[key], value) if key in merged else value
+        return merged
+
+    def samples(self, values: dict = None):
+        values = self.copy_values() if values is None else values
+        return [(f"{self.name}{self.label_str(k)}", v) for k, v in sorted(values.items())]
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self.lock:
+            self.values[self.key(labels)] = [value, time.time()] # When it was set, so merging can keep the latest
+
+    @staticmethod
+    def combine(a, b):
+        return a if a[1] >= b[1] else b
+
+    def samples(self, values: dict = None):
+        values = self.copy_values() if values is None else values
+        return [(f"{self.name}{self.label_str(k)}", v[0]) for k, v in sorted(values.items())]
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self.key(labels)
+        with self.lock:
+            series = self.values.setdefault(key, [[0] * len(self.buckets), 0.0, 0]) # [per-bucket counts, sum, count]
+            i = bisect.bisect_left(self.buckets, value)
+            if i < len(self.buckets): series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def copy_values(self) -> dict:
+        with self.lock:
+            return {k: [list(counts), total, count] for k, (counts, total, count) in self.values.items()}
+
+    @staticmethod
+    def combine(a, b):
+        return [[x + y for x, y in zip(a[0], b[0])], a[1] + b[1], a[2] + b[2]]
+
+    def samples(self, values: dict = None):
+        out = []
+        for key, (counts, total, count) in sorted((self.copy_values() if values is None else values).items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                out.append((f"{self.name}_bucket{self.label_str(key, {'le': f'{bound:g}'})}", cumulative))
+            out.append((f"{self.name}_bucket{self.label_str(key, {'le': '+Inf'})}", count))
+            out.append((f"{self.name}_sum{self.label_str(key)}", total))
+            out.append((f"{self.name}_count{self.label_str(key)}", count))
+        return out
+# endregion
+
+# region Registry
+_registry, _registry_lock = {}, threading.Lock()
+
+def _register(cls, name, *args, **kwargs):
+    """Returns the metric already registered under `name`, so module reloads don't duplicate it."""
+    with _registry_lock:
+        if name not in _registry: _registry[name] = cls(name, *args, **kwargs)
+        return _registry[name]
+
+def counter(name: str, help_text: str, labels: tuple = ()) -> Counter:
+    return _register(Counter, name, help_text, labels)
+
+def gauge(name: str, help_text: str, labels: tuple = ()) -> Gauge:
+    return _register(Gauge, name, help_text, labels)
+
+def histogram(name: str, help_text: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+    return _register(Histogram, name, help_text, labels, buckets)
+
+def registered() -> list:
+    with _registry_lock:
+        return list(_registry.values())
+# endregion
+
+# region Multiprocess
+# Every gunicorn worker keeps its own values, and a scrape lands on one of them. With this set,
+# each process writes its totals to <dir>/<pid>.json every METRICS_FLUSH_SECONDS (and when
+# rendering), and render() merges all the files, so every scrape sees the same totals.
+MULTIPROC_DIR = os.getenv("METRICS_MULTIPROC_DIR")
+FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "5"))
+
+_snapshot_lock = threading.Lock()
+_carried, _carried_pid = {}, None # Totals an earlier process with our pid left in our file
+
+def _snapshot_path(pid) -> str:
+    return os.path.join(MULTIPROC_DIR, f"{pid}.json")
+
+def _read_snapshot(path) -> dict:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        log.warning(f"Ignoring unreadable metrics snapshot {path}: {e}")
+        return {}
+
+def write_snapshot():
+    """
+    Replaces this process's file with its current totals. Files of exited workers stay,
+    so counters never go backwards; a new process that gets a reused pid carries on from
+    that file's totals instead of overwriting them.
+    """
+    global _carried, _carried_pid
+    pid = os.getpid()
+    with _snapshot_lock:
+        if _carried_pid != pid:
+            os.makedirs(MULTIPROC_DIR, exist_ok=True)
+            _carried, _carried_pid = _read_snapshot(_snapshot_path(pid)), pid
+        snapshot = {}
+        for metric in registered():
+            merged = metric.merge([_carried.get(metric.name, []), metric.export()])
+            snapshot[metric.name] = [[list(k), v] for k, v in merged.items()]
+        tmp_path = f"{_snapshot_path(pid)}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, _snapshot_path(pid))
+
+def _flush_forever():
+    while True:
+        time.sleep(FLUSH_SECONDS)
+        try:
+            write_snapshot()
+        except OSError as e:
+            log.warning(f"Could not write metrics snapshot: {e}")
+
+def _start_flusher():
+    threading.Thread(target=_flush_forever, name="metrics-flush", daemon=True).start()
+
+def _reset_after_fork():
+    """A forked worker starts from zero, with fresh locks; the parent's values stay in the parent's file."""
+    global _snapshot_lock
+    _snapshot_lock = threading.Lock()
+    for metric in _registry.values():
+        metric.lock, metric.values = threading.Lock(), {}
+    _start_flusher()
+
+if MULTIPROC_DIR:
+    _start_flusher()
+    os.register_at_fork(after_in_child=_reset_after_fork)
+    atexit.register(write_snapshot)
+# endregion
+
+# region Exposition
+def format_value(value) -> str:
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+def render() -> str:
+    """
+    All metrics in the Prometheus text exposition format. With METRICS_MULTIPROC_DIR set
+    this is every process's totals: counters and histograms add up, and each gauge series
+    takes the most recently set value.
+    """
+    snapshots = None
+    if MULTIPROC_DIR:
+        write_snapshot()
+        snapshots = [_read_snapshot(path) for path in glob.glob(os.path.join(MULTIPROC_DIR, "*.json"))]
+    lines = []
+    for metric in registered():
+        values = metric.merge(s.get(metric.name, []) for s in snapshots) if snapshots is not None else None
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(f"{name} {format_value(value)}" for name, value in metric.samples(values))
+    return "\n".join(lines) + "\n"
+# endregion
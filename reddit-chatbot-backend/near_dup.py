@@ -0,0 +1,79 @@
+import os
+import re
+import hashlib
+
+SIMHASH_BITS = 64
+MIN_TOKENS = 8 # Shorter posts ("Thoughts?") don't carry enough text to call them duplicates
+MAX_TOKENS = 400 # Copies agree from the start, so the head of a long post is enough and bounds the cost
+# Differing bits (of 64) that still count as the same post: copies with a few edited words
+# land around 4-10, unrelated posts 20+
+MAX_DISTANCE = int(os.getenv("NEAR_DUP_MAX_DISTANCE", "12"))
+UNKNOWN_AUTHORS = {None, "", "N/A", "[deleted]"}
+_BIT = [bytes(b >> (7 - k) & 1 for b in range(256)) for k in range(8)] # byte -> its k-th bit, most significant first
+
+def _tokens(text):
+    return re.findall(r'[a-z0-9]+', (text or "").lower())
+
+def simhash(title, selftext):
+    """
+    64-bit SimHash over the word shingles of title + body, as a signed integer so it fits
+    an SQLite INTEGER column. None when the post is too short to compare.
+    """
+    tokens = _tokens(f"{title or ''} {selftext or ''}")[:MAX_TOKENS]
+    if len(tokens) < MIN_TOKENS: return None
+    # Single words and word pairs. Posts are short (a median ~20 words), and longer shingles let
+    # a one-word edit move the signature as far as an unrelated post on the same topic does.
+    shingles = set(tokens) | {f"{a} {b}" for a, b in zip(tokens, tokens[1:])}
+    digests = b"".join(hashlib.blake2b(s.encode('utf-8'), digest_size=8).digest() for s in shingles)
+    # Bit i of the signature is the majority vote of bit i across the shingle hashes. Tallying
+    # a whole column with translate() + count() keeps the per-shingle work in C.
+    value = 0
+    for j in range(8):
+        column = digests[j::8] # Byte j of every hash
+        for k in range(8):
+            value = value << 1 | (column.translate(_BIT[k]).count(1) * 2 > len(shingles))
+    return value - (1 << SIMHASH_BITS) if value >> (SIMHASH_BITS - 1) else value
+
+def distance(a: int, b: int) -> int:
+    return bin((a ^ b) & ((1 << SIMHASH_BITS) - 1)).count("1")
+
+def find_canonical(conn, submission_id, author, signature, crosspost_parent=None):
+    """
+    The pending suggestion a newly scraped post belongs with, as (submission_id, match)
+    where match is "crosspost" or "simhash", or (None, None). Cross-posts join their
+    parent's group whoever posted them; otherwise the closest signature among the same
+    author's pending posts wins if it is within MAX_DISTANCE bits.
+    """
+    if crosspost_parent:
+        row = conn.execute('SELECT submission_id, status, canonical_id FROM suggestions WHERE submission_id=?', (crosspost_parent,)).fetchone()
+        if row and row['status'] == 'pending': return row['submission_id'], "crosspost"
+        if row and row['status'] == 'duplicate': return row['canonical_id'], "crosspost"
+    if signature is None or author in UNKNOWN_AUTHORS: return None, None
+    # Cross-posted questions come from one account, and an author rarely has more than a
+    # handful of posts pending, so the author index narrows this to a few rows
+    rows = conn.execute('''
+        SELECT submission_id, simhash FROM suggestions WHERE author=? AND status='pending'
+        AND canonical_id IS NULL AND simhash IS NOT NULL AND submission_id != ? ORDER BY id
+    ''', (author, submission_id)).fetchall()
+    best = min(rows, key=lambda r: distance(r['simhash'], signature), default=None)
+    if best and distance(best['simhash'], signature) <= MAX_DISTANCE: return best['submission_id'], "simhash"
+    return None, None
+
+def member_ids(conn, canonical_id) -> list:
+    return [r[0] for r in conn.execute("SELECT submission_id FROM suggestions WHERE canonical_id=? AND status='duplicate' ORDER BY id", (canonical_id,))]
+
+def members(conn, canonical_ids) -> dict:
+    """{canonical_id: [rows]} of the duplicates grouped under each of `canonical_ids`."""
+    if not canonical_ids: return {}
+    rows = conn.execute(f'''
+        SELECT canonical_id, submission_id, subreddit, post_url FROM suggestions
+        WHERE status='duplicate' AND canonical_id IN ({",".join("?" * len(canonical_ids))}) ORDER BY id
+    ''', list(canonical_ids)).fetchall()
+    grouped = {}
+    for r in rows:
+        grouped.setdefault(r['canonical_id'], []).append(r)
+    return grouped
+
+def release(conn, canonical_id) -> int:
+    """Turns a group's duplicates back into ordinary pending suggestions. The caller commits."""
+    return conn.execute("UPDATE suggestions SET status='pending', canonical_id=NULL WHERE canonical_id=? AND status='duplicate'", (canonical_id,)).rowcount
@@ -1,9 +1,17 @@
 import os
+import re
+import json
 import time
+import queue
+import signal
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 import praw
+import prawcore
+from praw.models.util import stream_generator
 import requests
-import sqlite3
 
 load_dotenv()
 
@@ -13,6 +21,19 @@ REDDIT_CLIENT_SECRET = os.getenv("REDDIT_CLIENT_SECRET")
 REDDIT_REFRESH_TOKEN = os.getenv("REDDIT_REFRESH_TOKEN")
 REDDIT_USER_AGENT    = os.getenv("REDDIT_USER_AGENT")
 FLASK_BACKEND_URL    = os.getenv("FLASK_BACKEND_URL", "").strip().rstrip('/')
+SCRAPER_WORKERS      = int(os.getenv("SCRAPER_WORKERS", "8"))
+SEND_BATCH_SIZE      = int(os.getenv("SEND_BATCH_SIZE", "50"))
+STATE_PATH           = os.getenv("SCRAPER_STATE_PATH", "scraper_state.json")
+MAX_CATCHUP_POSTS    = int(os.getenv("MAX_CATCHUP_POSTS", "1000")) # Reddit listings stop at ~1000 anyway
+# Posts held by the spam filter or AutoModerator show up in /new only once a mod approves them,
+# with their original (older) created_utc, so each run re-reads this far behind the cursor
+CURSOR_OVERLAP_SECONDS = int(os.getenv("CURSOR_OVERLAP_HOURS", "6")) * 60*60
+DAEMON_QUEUE_SIZE    = int(os.getenv("DAEMON_QUEUE_SIZE", "500"))
+DAEMON_FLUSH_SECONDS = float(os.getenv("DAEMON_FLUSH_SECONDS", "5"))
+DAEMON_MAX_PENDING   = int(os.getenv("DAEMON_MAX_PENDING", str(10 * SEND_BATCH_SIZE))) # Posts held while the backend is down
+DAEMON_MAX_BACKOFF_SECONDS = 300
+DAEMON_MAX_IDLE_SECONDS = float(os.getenv("DAEMON_MAX_IDLE_SECONDS", "30"))
+DAEMON_INDEX_REFRESH_SECONDS = int(os.getenv("DAEMON_INDEX_REFRESH_SECONDS", "600"))
 
 required_vars = ["REDDIT_CLIENT_ID", "REDDIT_CLIENT_SECRET", "REDDIT_REFRESH_TOKEN", "REDDIT_USER_AGENT", "FLASK_BACKEND_URL"]
 if not all(globals().get(v) for v in required_vars):
@@ -20,84 +41,510 @@ if not all(globals().get(v) for v in required_vars):
     exit(1)
 
 SUGGESTIONS_URL = FLASK_BACKEND_URL if FLASK_BACKEND_URL.endswith('/suggestions') else f"{FLASK_BACKEND_URL}/suggestions"
+BATCH_URL = f"{SUGGESTIONS_URL}/batch"
+METRICS_URL = f"{SUGGESTIONS_URL[:-len('/suggestions')]}/metrics/scraper"
+DEDUP_URL = f"{SUGGESTIONS_URL[:-len('/suggestions')]}/dedup/check"
+DEDUP_RECORD_URL = f"{SUGGESTIONS_URL[:-len('/suggestions')]}/dedup/record"
+DEDUP_CHECK_BATCH = 500
 
-reddit = praw.Reddit(
-    client_id=REDDIT_CLIENT_ID, client_secret=REDDIT_CLIENT_SECRET,
-    refresh_token=REDDIT_REFRESH_TOKEN, user_agent=REDDIT_USER_AGENT
-)
-BOT_USERNAME = reddit.user.me().name.lower()
+SUBREDDITS = ["SMPchat", "Hairloss", "bald", "tressless"]
+# Matched case-insensitively on word boundaries; phrases allow whitespace or hyphens between words
+KEYWORD_WEIGHTS = {
+    "smp": 3, "scalp micropigmentation": 3, "micropigmentation": 3, "hairline": 2, "hair loss": 2, "hairloss": 2,
+    "bald": 2, "balding": 2, "scalp": 1, "follicle": 1, "follicles": 1, "density": 1, "microblading": 1,
+    "tattoo": 1, "pigmentation": 1, "scar": 1, "scars": 1, "thinning": 1, "shaved head": 1, "buzz cut": 1,
+    "hair": 0.5,
+}
+# Per-subreddit overrides: how far back to look, the score a post needs, and weight tweaks
+DEFAULT_RULES = {"max_age_hours": 24, "min_score": 3, "weights": {}}
+SUBREDDIT_RULES = {
+    "smpchat": {"max_age_hours": 72, "min_score": 0},  # Everything there is on-topic
+    "bald": {"min_score": 2}, # The topic itself: "bald" anywhere in the post is enough
+    # Every post mentions these, so they only count on their own in the title ("Hair loss at 20")
+    "hairloss": {"min_score": 1, "weights": {"hair": 0, "hair loss": 0.5, "hairloss": 0.5}},
+    "tressless": {"min_score": 1, "weights": {"hair": 0, "hair loss": 0.5, "hairloss": 0.5}},
+}
+# endregion
+
+# region Relevance
+PHRASE_SEPARATOR = r"[\s-]+" # "hair loss", "hair-loss", "hair \n loss"
+
+class KeywordMatcher:
+    """
+    Scores text against weighted terms with one compiled, word-bounded regex, so "loss"
+    or "scar" inside unrelated words doesn't count. Each distinct term scores once;
+    title hits count double.
+    """
+
+    def __init__(self, weights: dict):
+        self.weights = {term.lower(): w for term, w in weights.items() if w > 0}
+        terms = sorted(self.weights, key=len, reverse=True) # Longest first so phrases win
+        alternation = "|".join(re.escape(t).replace(r"\ ", PHRASE_SEPARATOR) for t in terms) or r"(?!)"
+        self.pattern = re.compile(rf"\b(?:{alternation})\b", re.IGNORECASE)
+
+    def hits(self, text: str) -> set:
+        return {" ".join(re.split(PHRASE_SEPARATOR, m.group(0).lower())) for m in self.pattern.finditer(text or "")}
+
+    def score(self, title: str, body: str) -> float:
+        title_hits, body_hits = self.hits(title), self.hits(body)
+        return sum(self.weights[t] * (2 if t in title_hits else 1) for t in title_hits | body_hits)
+
+def build_rules(name: str) -> dict:
+    rules = {**DEFAULT_RULES, **SUBREDDIT_RULES.get(name, {})}
+    rules["matcher"] = KeywordMatcher({**KEYWORD_WEIGHTS, **rules["weights"]})
+    return rules
+
+RULES = {name: build_rules(name) for name in SUBREDDIT_RULES}
+RULES[None] = build_rules(None)
+
+def rules_for(subreddit_name: str) -> dict:
+    return RULES.get(subreddit_name.lower(), RULES[None])
+# endregion
+
+# region Rate limiting
+class RateLimitScheduler:
+    """
+    Shares one Reddit rate-limit budget between scraper threads.
+
+    Each PRAW client's limiter only looks at the last response it saw, so parallel workers
+    would all spend the same `remaining` count. Every Reddit call goes through `acquire()`,
+    which counts calls issued since the last x-ratelimit update (reported by any thread's
+    client through `BudgetRequestor`) and, once the budget gets down to `reserve`, holds
+    all callers until Reddit's 10-minute window rolls over.
+    """
+    WINDOW_SECONDS = 600
+
+    def __init__(self, reserve: int = 10):
+        self.reserve = reserve
+        self.lock = threading.Lock()
+        self.calls, self.remaining = 0, None
+        self._last_remaining, self._issued = None, 0
+
+    def observe(self, remaining: float):
+        with self.lock:
+            self.remaining = remaining
+
+    def acquire(self):
+        with self.lock:
+            remaining = self.remaining
+            if remaining != self._last_remaining:
+                self._last_remaining, self._issued = remaining, 0
+            if remaining is not None and remaining - self._issued <= self.reserve:
+                delay = self.WINDOW_SECONDS - time.time() % self.WINDOW_SECONDS
+                print(f"⏳ Rate-limit budget low ({remaining:.0f} left) – pausing {delay:.0f}s.")
+                time.sleep(delay)
+                self.remaining = self._last_remaining = None
+                self._issued = 0
+            self._issued += 1
+            self.calls += 1
+
+scheduler = RateLimitScheduler()
+
+class BudgetRequestor(prawcore.Requestor):
+    """Reports the x-ratelimit budget of every response to the shared scheduler, whichever client made the call."""
+    def request(self, *args, **kwargs):
+        response = super().request(*args, **kwargs)
+        remaining = response.headers.get("x-ratelimit-remaining")
+        if remaining: scheduler.observe(float(remaining))
+        return response
+# endregion
+
+# region Reddit clients
+_clients = threading.local()
+
+def reddit_client() -> praw.Reddit:
+    """
+    The calling thread's PRAW instance, created on first use. PRAW instances aren't
+    thread-safe (prawcore's token refresh takes no lock, and the HTTP session and limiter
+    state are shared), so each listing worker and the stream thread get their own.
+    """
+    client = getattr(_clients, "reddit", None)
+    if client is None:
+        client = _clients.reddit = praw.Reddit(
+            client_id=REDDIT_CLIENT_ID, client_secret=REDDIT_CLIENT_SECRET,
+            refresh_token=REDDIT_REFRESH_TOKEN, user_agent=REDDIT_USER_AGENT,
+            requestor_class=BudgetRequestor
+        )
+    return client
 
-KEYWORDS = ["smp", "hair", "scalp", "bald", "follicle", "loss", "density", "microblading", "tattoo", "pigmentation", "hairline", "scar", "scars"]
+BOT_USERNAME = reddit_client().user.me().name.lower()
+LISTING_PAGE_SIZE = 100 # The most Reddit returns per listing request
+
+def paged(path: str, limit: int = None, **params):
+    """
+    Iterates a Reddit listing (e.g. "r/bald/new") one request at a time, taking a scheduler
+    slot before each page is fetched. `limit=None` reads to the end of the listing.
+    """
+    remaining, after = float("inf") if limit is None else limit, None
+    while remaining > 0:
+        scheduler.acquire()
+        page = reddit_client().get(path, params={**params, "limit": int(min(LISTING_PAGE_SIZE, remaining)), **({"after": after} if after else {})})
+        yield from page
+        remaining, after = remaining - len(page), page.after
+        if not after or not len(page): return
 # endregion
 
-def get_posted_submission_ids():
-    posted_ids = set()
+# region Run stats
+STAGES = ("listed", "filtered", "deduped", "sent", "failed")
+
+class RunStats:
+    """Per-subreddit post counts since the last push to the backend, shared by the scraper threads."""
+
+    def __init__(self, scheduler: RateLimitScheduler):
+        self.scheduler, self.lock = scheduler, threading.Lock()
+        self.counts, self.pushed_calls = {}, 0
+
+    def count(self, subreddit: str, stage: str, n: int = 1):
+        with self.lock:
+            self.counts.setdefault(subreddit.lower(), dict.fromkeys(STAGES, 0))[stage] += n
+
+    def take(self) -> dict:
+        """Returns the counts and Reddit calls since the previous take() and starts over."""
+        with self.lock:
+            counts, self.counts = self.counts, {}
+            calls, self.pushed_calls = self.scheduler.calls - self.pushed_calls, self.scheduler.calls
+        return {"subreddits": counts, "reddit_calls": calls}
+
+run_stats = RunStats(scheduler)
+
+def push_run_stats(session, mode: str, duration: float = None):
+    """Adds this run's counts to the backend's /metrics; a failed push is only reported."""
+    payload = {**run_stats.take(), "mode": mode, "duration_seconds": duration, "ratelimit_remaining": scheduler.remaining}
     try:
-        db_path = os.environ.get("DB_PATH", "bot_data.db")
-        with sqlite3.connect(db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("CREATE TABLE IF NOT EXISTS posted_submissions (submission_id TEXT UNIQUE NOT NULL)")
-            cursor.execute("SELECT submission_id FROM posted_submissions")
-            posted_ids.update(row[0] for row in cursor.fetchall())
-        print(f"Found {len(posted_ids)} previously posted submission IDs.")
+        session.post(METRICS_URL, json=payload, timeout=10).raise_for_status()
     except Exception as e:
-        print(f"Error getting posted IDs: {e}")
-    return posted_ids
-
-def get_new_smp_posts(subreddit_name: str, posted_ids: set, limit: int = 50) -> list:
-    now = time.time()
-    window = 3*24*60*60 if subreddit_name.lower() == "smpchat" else 24*60*60
-    cutoff = now - window
-    new_posts = []
-
-    for sub in reddit.subreddit(subreddit_name).new(limit=limit):
-        if sub.created_utc < cutoff or sub.id in posted_ids: continue
-
-        title_text, body_text = sub.title.lower(), sub.selftext.lower()
-        if subreddit_name.lower() != "smpchat" and not any(k in title_text or k in body_text for k in KEYWORDS):
-            continue
-            
-        sub.comments.replace_more(limit=0)
-        if any(c.author and c.author.name.lower() == BOT_USERNAME for c in sub.comments.list()):
-            print(f" - Skipping '{sub.title}' (already commented manually).")
-            continue
-
-        images = []
-        if hasattr(sub, "gallery_data") and sub.gallery_data:
-            for item in sub.gallery_data.get("items", []):
-                media_id = item.get("media_id")
-                if media_id in sub.media_metadata:
-                    images.append(sub.media_metadata[media_id].get("s", {}).get("u"))
-        elif not sub.is_self and sub.url.lower().endswith((".jpg", ".jpeg", ".png", ".gif")):
-            images.append(sub.url)
-
-        print(f"✅ Found relevant post: {sub.title}")
-        new_posts.append({
-            "submission_id": sub.id, "redditPostTitle": sub.title,
-            "author": sub.author.name if sub.author else "N/A",
-            "subreddit": sub.subreddit.display_name, "redditPostSelftext": sub.selftext,
-            "redditPostUrl": f"https://reddit.com{sub.permalink}",
-            "image_urls": [img for img in images if img]
-        })
-    return new_posts
+        print(f"⚠️ Could not push run stats to {METRICS_URL}: {e}")
+# endregion
 
-if __name__ == "__main__":
-    subs_to_scrape = ["SMPchat", "Hairloss", "bald", "tressless"]
-    all_new_posts = []
-    
-    # Fetch posted IDs only ONCE for efficiency
-    already_posted_ids = get_posted_submission_ids()
-
-    for s in subs_to_scrape:
-        posts = get_new_smp_posts(s, already_posted_ids, limit=50)
-        print(f"Fetched {len(posts)} new from r/{s}")
-        all_new_posts.extend(posts)
-
-    print(f"\nTotal new posts to send: {len(all_new_posts)}")
-    for post in all_new_posts:
+# region Scraper state
+def load_state() -> dict:
+    try:
+        with open(STATE_PATH, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        print(f"⚠️ Could not read {STATE_PATH}, starting fresh: {e}")
+        return {}
+
+def save_state(state: dict):
+    tmp_path = f"{STATE_PATH}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, STATE_PATH)
+
+def sync_commented_index(state: dict, session) -> int:
+    """
+    Records the submissions the bot account has replied to as "posted" in the backend's
+    dedup store, which `filter_known` checks. Only the newest comment recorded is kept in
+    `state["commented"]`: the first run walks the whole history, later runs stop there, so
+    a quiet run costs one call. If recording fails, the next run tries the same comments again.
+    """
+    index = state.setdefault("commented", {"newest_comment": None})
+    newest_seen, newest_now = index.get("newest_comment"), None
+    submission_ids = set(index.get("ids", [])) # The full set older versions kept here, handed over once
+
+    for comment in paged(f"user/{BOT_USERNAME}/comments", sort="new"):
+        if comment.id == newest_seen: break
+        newest_now = newest_now or comment.id
+        submission_ids.add(comment.link_id.split("_", 1)[-1])
+
+    ids = sorted(submission_ids)
+    try:
+        for i in range(0, len(ids), DEDUP_CHECK_BATCH):
+            session.post(DEDUP_RECORD_URL, json={"ids": ids[i:i + DEDUP_CHECK_BATCH], "state": "posted"}, timeout=10).raise_for_status()
+    except Exception as e:
+        print(f"⚠️ Could not record {len(ids)} commented submissions: {e}")
+        return 0
+    index.pop("ids", None)
+    index["newest_comment"] = newest_now or newest_seen
+    if ids: print(f"Recorded {len(ids)} submissions the bot has commented on.")
+    return len(ids)
+# endregion
+
+def filter_known(posts: list, session) -> list:
+    """
+    Drops posts the backend's dedup store already has (seen, posted or rejected). If the
+    check fails, everything is sent anyway; the ingest endpoint skips known posts itself.
+    """
+    known = set()
+    for i in range(0, len(posts), DEDUP_CHECK_BATCH):
+        chunk = posts[i:i + DEDUP_CHECK_BATCH]
         try:
-            resp = requests.post(SUGGESTIONS_URL, json=post, timeout=10)
+            resp = session.post(DEDUP_URL, json={"ids": [p['submission_id'] for p in chunk]}, timeout=10)
             resp.raise_for_status()
-            print(f"✅ Sent {post['submission_id']}: {post['redditPostTitle']}")
+            known.update(resp.json().get("known", {}))
         except Exception as e:
-            print(f"❌ Failed to send {post['submission_id']}: {e}")
\ No newline at end of file
+            print(f"⚠️ Dedup check failed, sending {len(chunk)} posts unchecked: {e}")
+    for p in posts:
+        if p['submission_id'] in known: run_stats.count(p['subreddit'], "deduped")
+    return [p for p in posts if p['submission_id'] not in known]
+
+def build_post_payload(sub) -> dict:
+    """
+    Post fields for the backend. `image_previews` lines up with `image_urls`: Reddit's
+    downsized renditions of each image ({"u", "x", "y"}, smallest first), which the
+    backend's thumbnail proxy uses instead of the full-size source. `crosspost_parent` lets
+    the backend group a cross-post with the original.
+    """
+    images, previews = [], []
+    data = vars(sub) # Attribute lookups on a missing key would make PRAW fetch the whole post
+    if data.get("gallery_data"):
+        for item in data["gallery_data"].get("items", []):
+            media = (data.get("media_metadata") or {}).get(item.get("media_id"), {})
+            if media.get("s", {}).get("u"):
+                images.append(media["s"]["u"])
+                previews.append(media.get("p", []))
+    elif not sub.is_self and sub.url.lower().endswith((".jpg", ".jpeg", ".png", ".gif")):
+        images.append(sub.url)
+        resolutions = ((data.get("preview") or {}).get("images") or [{}])[0].get("resolutions", [])
+        previews.append([{"u": r["url"], "x": r["width"], "y": r["height"]} for r in resolutions])
+
+    return {
+        "submission_id": sub.id, "redditPostTitle": sub.title,
+        "author": sub.author.name if sub.author else "N/A",
+        "subreddit": sub.subreddit.display_name, "redditPostSelftext": sub.selftext,
+        "redditPostUrl": f"https://reddit.com{sub.permalink}",
+        "image_urls": images,
+        "image_previews": [sorted(p, key=lambda r: r.get("x", 0)) for p in previews],
+        "crosspost_parent": (data.get("crosspost_parent") or "").split("_")[-1] or None # "t3_abc123" -> "abc123"
+    }
+
+def evaluate_submission(sub, rules: dict):
+    """Returns the post payload if the submission is relevant, else None."""
+    subreddit = sub.subreddit.display_name
+    run_stats.count(subreddit, "listed")
+    score = rules["matcher"].score(sub.title, sub.selftext) if rules["min_score"] > 0 else 0
+    if score < rules["min_score"]:
+        run_stats.count(subreddit, "filtered")
+        return None
+
+    print(f"✅ Found relevant post (score {score:g}): {sub.title}")
+    return build_post_payload(sub)
+
+def is_behind_cursor(sub, cursor: dict) -> bool:
+    """True once a post is older than the cursor's overlap window; posts inside it are checked again (the dedup store drops repeats)."""
+    return bool(cursor) and sub.created_utc < cursor["created_utc"] - CURSOR_OVERLAP_SECONDS
+
+def get_new_smp_posts(subreddit_name: str, cursor: dict = None, limit: int = MAX_CATCHUP_POSTS):
+    """
+    Pages through a subreddit's new queue until it gets CURSOR_OVERLAP_SECONDS behind
+    `cursor` (the newest post seen last run) or reaches the age cutoff, and returns
+    (relevant posts, updated cursor). Posts the bot already answered are dropped later by
+    the backend's dedup check (see `sync_commented_index`), so no per-post comment fetch is needed.
+    """
+    rules = rules_for(subreddit_name)
+    cutoff = time.time() - rules["max_age_hours"]*60*60
+    new_posts, newest = [], cursor
+
+    for sub in paged(f"r/{subreddit_name}/new", limit):
+        if is_behind_cursor(sub, cursor) or sub.created_utc < cutoff: break
+        if not newest or sub.created_utc > newest["created_utc"]:
+            newest = {"fullname": sub.fullname, "created_utc": sub.created_utc}
+        payload = evaluate_submission(sub, rules)
+        if payload: new_posts.append(payload)
+    return new_posts, newest
+
+def scrape_subreddits(subreddit_names: list, cursors: dict = None, workers: int = SCRAPER_WORKERS):
+    """
+    Scrapes all subreddits concurrently, one listing (and PRAW client) per thread, paced by
+    the shared `scheduler`. Returns (posts in subreddit order, {subreddit: seconds}, {subreddit: cursor}).
+    """
+    cursors = cursors or {}
+    results, timings, new_cursors = {}, {}, {}
+
+    def scrape_one(name):
+        start = time.perf_counter()
+        try:
+            return get_new_smp_posts(name, cursor=cursors.get(name.lower()))
+        finally:
+            timings[name] = time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(subreddit_names)))) as listing_pool:
+        futures = {listing_pool.submit(scrape_one, name): name for name in subreddit_names}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                results[name], new_cursors[name.lower()] = future.result()
+            except Exception as e:
+                print(f"❌ Failed to scrape r/{name}: {e}")
+                results[name], new_cursors[name.lower()] = [], cursors.get(name.lower())
+
+    return [post for name in subreddit_names for post in results[name]], timings, new_cursors
+
+def send_posts(posts: list, session=None, batch_size: int = SEND_BATCH_SIZE) -> dict:
+    """
+    Delivers posts to the backend in chunks over one keep-alive session, one request
+    (and one DB transaction) per chunk. Returns {submission_id: status}.
+    """
+    session = session or requests.Session()
+    statuses = {}
+    for i in range(0, len(posts), batch_size):
+        chunk = posts[i:i + batch_size]
+        try:
+            resp = session.post(BATCH_URL, json={"suggestions": chunk}, timeout=30)
+            resp.raise_for_status()
+            for result in resp.json().get("results", []):
+                statuses[result["submission_id"]] = result["status"]
+            for p in chunk:
+                run_stats.count(p['subreddit'], {"added": "sent", "duplicate": "deduped"}.get(statuses.get(p['submission_id']), "failed"))
+            added = sum(statuses.get(p['submission_id']) == "added" for p in chunk)
+            print(f"✅ Sent batch of {len(chunk)} ({added} added, {len(chunk) - added} already known)")
+        except Exception as e:
+            print(f"❌ Failed to send batch of {len(chunk)}: {e}")
+            statuses.update((p['submission_id'], "failed") for p in chunk)
+            for p in chunk: run_stats.count(p['subreddit'], "failed")
+    return statuses
+
+def deliver(posts: list, state: dict, new_cursors: dict, session) -> list:
+    """
+    Sends the posts the backend doesn't know yet and moves each subreddit's cursor forward
+    only once everything found in it was delivered. Returns the posts that failed to send.
+    """
+    posts = filter_known(posts, session)
+    statuses = send_posts(posts, session)
+    failed = [p for p in posts if statuses.get(p['submission_id']) == "failed"]
+    failed_subs = {p['subreddit'].lower() for p in failed}
+    state.setdefault("cursors", {}).update((name, cursor) for name, cursor in new_cursors.items() if cursor and name not in failed_subs)
+    save_state(state)
+    return failed
+
+def run_once(subreddit_names: list):
+    state = load_state()
+
+    run_start = time.perf_counter()
+    with requests.Session() as session:
+        sync_commented_index(state, session)
+        save_state(state)
+        all_new_posts, timings, new_cursors = scrape_subreddits(subreddit_names, state.setdefault("cursors", {}))
+        print(f"\n⏱ Scraped {len(subreddit_names)} subreddits in {time.perf_counter() - run_start:.2f}s "
+              f"({scheduler.calls} Reddit calls, {SCRAPER_WORKERS} workers)")
+        for s in subreddit_names:
+            print(f"   r/{s}: {sum(p['subreddit'].lower() == s.lower() for p in all_new_posts)} new in {timings.get(s, 0):.2f}s")
+
+        print(f"\nTotal new posts to send: {len(all_new_posts)}")
+        deliver(all_new_posts, state, new_cursors, session)
+        push_run_stats(session, "once", time.perf_counter() - run_start)
+
+# region Daemon
+def stream_submissions(subreddit_names: list, out_queue: queue.Queue, stop: threading.Event):
+    """
+    Producer thread: one stream over the combined r/a+b+c listing covers every subreddit
+    with a single poll. Empty polls back off up to DAEMON_MAX_IDLE_SECONDS; a full queue
+    blocks the producer (backpressure) until the filter stage catches up.
+    """
+    listing = reddit_client().subreddit("+".join(subreddit_names))
+    def poll(**kwargs):
+        scheduler.acquire() # Each poll is one listing request: count it and respect the shared budget
+        return listing.new(**kwargs)
+
+    idle = 1.0
+    while not stop.is_set():
+        try:
+            for sub in stream_generator(poll, pause_after=0): # What listing.stream.submissions() does, minus the accounting
+                if stop.is_set(): return
+                if sub is None: # Poll came back empty
+                    stop.wait(idle)
+                    idle = min(idle * 2, DAEMON_MAX_IDLE_SECONDS)
+                    continue
+                idle = 1.0
+                while not stop.is_set():
+                    try:
+                        out_queue.put(sub, timeout=1)
+                        break
+                    except queue.Full:
+                        continue
+        except Exception as e:
+            print(f"❌ Stream error, reconnecting in 30s: {e}")
+            stop.wait(30)
+
+def run_daemon(subreddit_names: list):
+    """
+    Long-running mode: catches up from the saved cursors, then streams new submissions
+    through filter -> batched delivery until SIGINT/SIGTERM, draining what's queued and
+    saving cursors on the way out so the next start resumes where this one stopped.
+    While the backend is down, deliveries back off exponentially and at most
+    DAEMON_MAX_PENDING posts wait; past that the stream blocks on the full queue.
+    """
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop.set())
+
+    run_once(subreddit_names) # Covers anything posted while we were down
+    state = load_state()
+    cursors = state.setdefault("cursors", {})
+
+    submissions = queue.Queue(maxsize=DAEMON_QUEUE_SIZE)
+    threading.Thread(target=stream_submissions, args=(subreddit_names, submissions, stop), name="stream", daemon=True).start()
+    print(f"📡 Streaming r/{'+'.join(subreddit_names)} (Ctrl+C to stop)")
+
+    pending, seen = [], {}
+    last_flush = last_index = time.monotonic()
+    retry_at, backoff = 0.0, DAEMON_FLUSH_SECONDS
+
+    def flush() -> bool:
+        """Delivers `pending` and saves the cursors in `seen`; failed posts stay pending. Returns whether all went out."""
+        nonlocal pending, seen
+        try:
+            pending = deliver(pending, state, seen, session)
+            seen = {n: c for n, c in seen.items() if n in {p['subreddit'].lower() for p in pending}}
+        except Exception as e:
+            print(f"❌ Delivery failed: {e}")
+        push_run_stats(session, "daemon")
+        return not pending
+
+    with requests.Session() as session:
+        # Once stopping, drain what's queued unless the backend is down and `pending` is full
+        while not stop.is_set() or (not submissions.empty() and len(pending) < DAEMON_MAX_PENDING):
+            if len(pending) < DAEMON_MAX_PENDING:
+                try:
+                    sub = submissions.get(timeout=1)
+                except queue.Empty:
+                    sub = None
+            else: # Leave the queue alone so the stream thread blocks on it until deliveries resume
+                sub = None
+                stop.wait(1)
+
+            if sub is not None:
+                try:
+                    name = sub.subreddit.display_name.lower()
+                    if not is_behind_cursor(sub, cursors.get(name)):
+                        if sub.created_utc >= seen.get(name, {}).get("created_utc", 0):
+                            seen[name] = {"fullname": sub.fullname, "created_utc": sub.created_utc}
+                        payload = evaluate_submission(sub, rules_for(name))
+                        if payload: pending.append(payload)
+                except Exception as e:
+                    print(f"❌ Skipping submission {getattr(sub, 'id', '?')}: {e}")
+
+            now = time.monotonic()
+            if (pending or seen) and (len(pending) >= SEND_BATCH_SIZE or now - last_flush >= DAEMON_FLUSH_SECONDS) and now >= retry_at:
+                if flush():
+                    retry_at, backoff = 0.0, DAEMON_FLUSH_SECONDS
+                else: # Backend unreachable or failing: back off instead of retrying on every pass
+                    retry_at = time.monotonic() + backoff
+                    print(f"⏳ {len(pending)} posts waiting for the backend; next delivery in {backoff:.0f}s.")
+                    backoff = min(backoff * 2, DAEMON_MAX_BACKOFF_SECONDS)
+                last_flush = time.monotonic()
+
+            if time.monotonic() - last_index >= DAEMON_INDEX_REFRESH_SECONDS:
+                try:
+                    sync_commented_index(state, session)
+                    save_state(state)
+                except Exception as e:
+                    print(f"❌ Could not refresh the commented-posts index: {e}")
+                last_index = time.monotonic()
+
+        if pending or seen: flush() # One last try on the way out, backoff or not
+
+    if pending: print(f"⚠️ {len(pending)} posts could not be delivered; they will be picked up on the next start.")
+    print("👋 Daemon stopped; cursors saved.")
+# endregion
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrape subreddits for SMP-related posts and send them to the dashboard backend.")
+    parser.add_argument("--daemon", action="store_true", help="keep running and stream new posts instead of scraping once")
+    args = parser.parse_args()
+    if args.daemon:
+        run_daemon(SUBREDDITS)
+    else:
+        run_once(SUBREDDITS)
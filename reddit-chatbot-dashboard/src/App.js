@@ -1,50 +1,94 @@
-import React, { useState, useEffect, useCallback } from 'react';
+import React, { useState, useEffect, useCallback, useRef } from 'react';
 import './App.css';
 
+const PAGE_SIZE = 50;
+const SYNC_INTERVAL_MS = 30000;
+// Same order the API pages in; only needed to slot delta updates into the loaded list
+const byQueueOrder = (a, b) => (b.priority - a.priority) || (b.added_at - a.added_at);
+
 function App() {
   const [pendingComments, setPendingComments] = useState([]);
   const [initialThoughts, setInitialThoughts] = useState({});
   const [expanded, setExpanded] = useState({});
   const [lightboxImage, setLightboxImage] = useState(null);
+  const [bulkJobIds, setBulkJobIds] = useState([]);
+  const [skipDuplicates, setSkipDuplicates] = useState({});
 
   const API_URL = process.env.REACT_APP_API_URL || 'http://localhost:5000';
 
-  const fetchSuggestions = useCallback(async () => {
+  const [nextCursor, setNextCursor] = useState(null);
+  const syncRef = useRef({ token: null, etag: null });
+
+  // Initialize state for new posts without wiping existing user input
+  const trackNewPosts = useCallback(posts => {
+    setInitialThoughts(prev => {
+      const newThoughts = { ...prev };
+      posts.forEach(post => { if (newThoughts[post.id] === undefined) newThoughts[post.id] = ''; });
+      return newThoughts;
+    });
+    setExpanded(prev => {
+      const newExpanded = { ...prev };
+      posts.forEach(post => { if (newExpanded[post.id] === undefined) newExpanded[post.id] = false; });
+      return newExpanded;
+    });
+  }, []);
+
+  const fetchSuggestions = useCallback(async (cursor = null) => {
     try {
-      const res = await fetch(`${API_URL}/suggestions`);
+      const params = new URLSearchParams({ limit: PAGE_SIZE });
+      if (cursor) params.set('cursor', cursor);
+      const res = await fetch(`${API_URL}/suggestions?${params}`);
       if (!res.ok) throw new Error(`HTTP error! status: ${res.status}`);
       const data = await res.json();
-      
-      data.sort((a, b) => {
-        const aPri = a.subreddit?.toLowerCase() === 'smpchat';
-        const bPri = b.subreddit?.toLowerCase() === 'smpchat';
-        if (aPri && !bPri) return -1;
-        if (!aPri && bPri) return 1;
-        return (b.added_at || 0) - (a.added_at || 0);
-      });
 
-      setPendingComments(data);
-      // Initialize state for new posts without wiping existing user input
-      setInitialThoughts(prev => {
-        const newThoughts = { ...prev };
-        data.forEach(post => { if (newThoughts[post.id] === undefined) newThoughts[post.id] = ''; });
-        return newThoughts;
-      });
-      setExpanded(prev => {
-        const newExpanded = { ...prev };
-        data.forEach(post => { if (newExpanded[post.id] === undefined) newExpanded[post.id] = false; });
-        return newExpanded;
+      // A delta sync may already have merged some of this page's rows
+      setPendingComments(prev => {
+        if (!cursor) return data.items;
+        const loaded = new Set(prev.map(p => p.id));
+        return [...prev, ...data.items.filter(p => !loaded.has(p.id))];
       });
+      setNextCursor(data.next_cursor);
+      if (!cursor) syncRef.current = { token: data.sync_token, etag: null };
+      trackNewPosts(data.items);
     } catch (err) {
       console.error('Error fetching suggestions:', err);
     }
-  }, [API_URL]);
+  }, [API_URL, trackNewPosts]);
+
+  // Asks only for what changed since the last sync; an unchanged queue answers 304
+  const syncSuggestions = useCallback(async () => {
+    const { token, etag } = syncRef.current;
+    if (token === null) return;
+    try {
+      const res = await fetch(`${API_URL}/suggestions?since=${token}`, { headers: etag ? { 'If-None-Match': etag } : {} });
+      if (res.status === 304) return;
+      if (!res.ok) throw new Error(`HTTP error! status: ${res.status}`);
+      const data = await res.json();
+      if (data.reset) { fetchSuggestions(); return; }
+
+      syncRef.current = { token: data.sync_token, etag: res.headers.get('ETag') };
+      setPendingComments(prev => {
+        // Changed rows below the last loaded one belong to pages not fetched yet; "Load More" brings them in order
+        const loaded = new Set(prev.map(p => p.id)), last = prev[prev.length - 1];
+        const visible = data.items.filter(p => loaded.has(p.id) || !nextCursor || !last || byQueueOrder(p, last) <= 0);
+        const replaced = new Set([...data.removed, ...visible.map(p => p.id)]);
+        return [...prev.filter(p => !replaced.has(p.id)), ...visible].sort(byQueueOrder);
+      });
+      trackNewPosts(data.items);
+    } catch (err) {
+      console.error('Error syncing suggestions:', err);
+    }
+  }, [API_URL, fetchSuggestions, trackNewPosts, nextCursor]);
 
-  // This useEffect now runs only once when the app loads
   useEffect(() => {
     fetchSuggestions();
   }, [fetchSuggestions]);
 
+  useEffect(() => {
+    const timer = setInterval(syncSuggestions, SYNC_INTERVAL_MS);
+    return () => clearInterval(timer);
+  }, [syncSuggestions]);
+
   const handleEdit = (id, field, value) => {
     if (field === 'thoughts') {
       setInitialThoughts(prev => ({ ...prev, [id]: value }));
@@ -57,14 +101,14 @@ function App() {
   const openLightbox = url => setLightboxImage(url);
   const closeLightbox = () => setLightboxImage(null);
 
-  const handleGenerate = async id => {
+  const handleGenerate = async (id, regenerate = false) => {
     const thoughts = initialThoughts[id] || '';
     setPendingComments(prev => prev.map(p => p.id === id ? { ...p, suggestedComment: 'Generating...' } : p));
     try {
       const res = await fetch(`${API_URL}/suggestions/${id}/generate`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ user_thought: thoughts })
+        body: JSON.stringify({ user_thought: thoughts, regenerate })
       });
       const json = await res.json();
       if (!res.ok) throw new Error(json.error || 'Generation failed');
@@ -77,6 +121,36 @@ function App() {
     }
   };
 
+  const handleGenerateAll = async () => {
+    try {
+      const res = await fetch(`${API_URL}/suggestions/generate-pending`, { method: 'POST' });
+      const json = await res.json();
+      if (!res.ok) throw new Error(json.error || 'Bulk generation failed');
+      setBulkJobIds(json.jobs.map(j => j.job_id));
+    } catch (err) {
+      console.error('Bulk generate error:', err);
+      alert(`Failed to queue drafts: ${err.message}`);
+    }
+  };
+
+  // While bulk drafts are being generated, poll their jobs and reload the queue once they finish
+  useEffect(() => {
+    if (bulkJobIds.length === 0) return;
+    const timer = setInterval(async () => {
+      try {
+        const res = await fetch(`${API_URL}/jobs?ids=${bulkJobIds.join(',')}`);
+        if (!res.ok) throw new Error(`HTTP error! status: ${res.status}`);
+        const jobs = await res.json();
+        const active = jobs.filter(j => j.status === 'queued' || j.status === 'running');
+        if (active.length < bulkJobIds.length) syncSuggestions();
+        setBulkJobIds(active.map(j => j.job_id));
+      } catch (err) {
+        console.error('Job poll error:', err);
+      }
+    }, 3000);
+    return () => clearInterval(timer);
+  }, [API_URL, bulkJobIds, syncSuggestions]);
+
   const handleAction = async (id, actionType) => {
     const post = pendingComments.find(p => p.id === id);
     let url = '', opts = {};
@@ -84,7 +158,7 @@ function App() {
     if (actionType === 'approve') {
       if (!post.suggestedComment?.trim() || post.suggestedComment === 'Generating...') { alert('Please generate a valid comment first.'); return; }
       url = `${API_URL}/suggestions/${id}/approve-and-post`;
-      opts = { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ approved_comment: post.suggestedComment }) };
+      opts = { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ approved_comment: post.suggestedComment, include_duplicates: !skipDuplicates[id] }) };
     } else if (actionType === 'reject') {
       url = `${API_URL}/suggestions/${id}`;
       opts = { method: 'DELETE' };
@@ -93,13 +167,15 @@ function App() {
       if (!txt.trim()) { alert('Please enter your thoughts.'); return; }
       if (!window.confirm('Post your thoughts directly?')) return;
       url = `${API_URL}/suggestions/${id}/post-direct`;
-      opts = { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ direct_comment: txt }) };
+      opts = { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ direct_comment: txt, include_duplicates: !skipDuplicates[id] }) };
     } else { return; }
 
     try {
       const res = await fetch(url, opts);
       if (!res.ok) throw new Error( (await res.json()).error || 'Action failed' );
       setPendingComments(prev => prev.filter(p => p.id !== id));
+      // Duplicates left out of the reply come back as their own cards
+      if (skipDuplicates[id] && post.duplicates?.length) syncSuggestions();
     } catch (err) {
       console.error('Action error:', err);
       alert(`Action failed: ${err.message}`);
@@ -113,7 +189,12 @@ function App() {
 
   return (
     <div className="App">
-      <header className="App-header"><h1>Reddit Comment Review</h1></header>
+      <header className="App-header">
+        <h1>Reddit Comment Review</h1>
+        <button className="generate-button" onClick={handleGenerateAll} disabled={bulkJobIds.length > 0}>
+          {bulkJobIds.length > 0 ? `Generating ${bulkJobIds.length} drafts...` : 'Generate All Drafts'}
+        </button>
+      </header>
       <div className="comment-list">
         {pendingComments.map(c => (
           <div key={c.id} className="comment-card">
@@ -138,10 +219,27 @@ function App() {
               </div>
             )}
 
+            {c.duplicates && c.duplicates.length > 0 && (
+              <div className="duplicate-group">
+                <span>Also posted in </span>
+                {c.duplicates.map((d, i) => (
+                  <React.Fragment key={d.id}>
+                    {i > 0 && ', '}
+                    <a href={d.redditPostUrl} target="_blank" rel="noopener noreferrer">r/{d.subreddit}</a>
+                  </React.Fragment>
+                ))}
+                <label className="duplicate-toggle">
+                  <input type="checkbox" checked={!skipDuplicates[c.id]} onChange={e => setSkipDuplicates(prev => ({ ...prev, [c.id]: !e.target.checked }))} />
+                  Reply to all {c.duplicates.length + 1}
+                </label>
+              </div>
+            )}
+
             {c.image_urls && c.image_urls.length > 0 && (
               <div className="image-preview-container">
                 {c.image_urls.map((url, i) => (
-                  <img key={i} src={url} alt={`post content ${i+1}`} className="post-image-preview" onClick={() => openLightbox(url)} />
+                  // Cached thumbnail from the backend; the full-size original only loads in the lightbox
+                  <img key={i} src={`${API_URL}/images/${c.id}/${i}`} alt={`post content ${i+1}`} loading="lazy" className="post-image-preview" onClick={() => openLightbox(url)} />
                 ))}
               </div>
             )}
@@ -155,6 +253,7 @@ function App() {
                 <textarea className="suggested-textarea" rows={4} value={c.suggestedComment} onChange={e => handleEdit(c.id, 'suggestion', e.target.value)} />
                 <div className="actions">
                   <button className="approve-button" onClick={() => handleAction(c.id, 'approve')}>Approve & Post</button>
+                  <button className="generate-button" onClick={() => handleGenerate(c.id, true)}>Regenerate</button>
                   <button className="reject-button" onClick={() => handleAction(c.id, 'reject')}>Reject</button>
                 </div>
               </>
@@ -166,6 +265,7 @@ function App() {
             )}
           </div>
         ))}
+        {nextCursor && <button className="see-more-button" onClick={() => fetchSuggestions(nextCursor)}>Load More</button>}
       </div>
       {lightboxImage && (
         <div className="lightbox-overlay active" onClick={closeLightbox}>
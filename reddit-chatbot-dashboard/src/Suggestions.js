@@ -8,7 +8,7 @@ export default function Suggestions() {
   useEffect(() => {
     fetch(`${API}/suggestions`)
       .then(r => r.json())
-      .then(data => setPosts(data))
+      .then(data => setPosts(data.items))
       .catch(console.error)
   }, [])
 